@@ -7,9 +7,23 @@ This is a temporary script file.
 
 import graco.distance_matrices
 import graco.distances
+import graco.cache
+import graco.feature_sets
+import graco.transport
+import graco.gcm
+import graco.neighbors
 
 from graco.core import *
 from graco.functions import Calculate
+from graco.dynamic import DynamicGDV
+from graco.gcv import GCVArray
+from graco.condensed import CondensedMatrix
+from graco.transport import sinkhorn
+from graco.neighbors import knn
 
 orbits = Calculate.orbits
+sampled_orbits = Calculate.sampled_orbits
 coefficients = Calculate.coefficients
+features = Calculate.features
+orbits_many = Calculate.orbits_many
+coefficients_many = Calculate.coefficients_many
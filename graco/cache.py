@@ -0,0 +1,165 @@
+"""
+Opt-in on-disk cache for orbit counts and coefficients.
+
+Entries are addressed by a hash of the graph's node labels and edge set, so
+the same network read twice (or by different processes) shares its entries.
+Every entry is a single .npz file that is written to a temporary file
+and moved into place, which makes concurrent readers and writers safe. The
+directory is kept below `max_size` bytes by deleting the least recently used
+entries.
+
+    graco.cache.enable('/path/to/cache', max_size=2**30)
+    graco.orbits(G)          # computed and stored
+    graco.orbits(G)          # loaded
+    graco.cache.CACHE.hits   # 1
+"""
+
+import scipy.sparse
+import pandas as pd
+import numpy as np
+import tempfile
+import hashlib
+import os
+
+CACHE = None
+
+def enable(path, max_size=2**30):
+    global CACHE
+    CACHE = Cache(path, max_size)
+    return CACHE
+
+def disable():
+    global CACHE
+    CACHE = None
+
+
+class GraphKey:
+    """
+    Canonical hash of a graph given by its node labels and symmetric
+    adjacency matrix. Nodes are ordered by the repr of their labels, `order`
+    holds the canonical position of every node.
+    """
+    def __init__(self, nodes, A, graphlet_nodes=4):
+        labels = [repr(node) for node in nodes]
+        canonical = np.argsort(labels, kind='stable')
+        position = np.empty(len(labels), dtype=np.int64)
+        position[canonical] = np.arange(len(labels))
+
+        U = scipy.sparse.triu(A, k=1, format='coo')
+        edges = np.column_stack([position[U.row], position[U.col]])
+        edges = np.unique(np.sort(edges, axis=1), axis=0)
+
+        sha = hashlib.sha256()
+        sha.update(f"{graphlet_nodes}\n".encode())
+        sha.update('\n'.join(labels[n] for n in canonical).encode())
+        sha.update(np.ascontiguousarray(edges, dtype='<i8').tobytes())
+        self.digest = sha.hexdigest()
+        self.order  = position
+
+
+class Cache:
+    def __init__(self, path, max_size=2**30):
+        self.path     = path
+        self.max_size = max_size
+        self.hits     = 0
+        self.misses   = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _filename(self, key, kind):
+        return os.path.join(self.path, f"{key.digest}.{kind}.npz")
+
+    def load(self, key, kind):
+        """
+        Returns the cached arrays of `kind` in the node order of the graph
+        that `key` was built from, or None.
+        """
+        filename = self._filename(key, kind)
+        try:
+            with np.load(filename, allow_pickle=False) as f:
+                arrays = {name:f[name] for name in f.files}
+            os.utime(filename)
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        arrays['values'] = arrays['values'][key.order]
+        return arrays
+
+    def store(self, key, kind, values, **arrays):
+        canonical = np.empty_like(values)
+        canonical[key.order] = values
+
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, values=canonical, **arrays)
+        os.replace(tmp, self._filename(key, kind))
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits into
+        max_size bytes.
+        """
+        entries = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith('.npz'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, filename in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def clear(self):
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.npz'):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+def load_GDV(nodes, A, graphlet_nodes=4):
+    """
+    Returns the cached GDV array of the graph and its key, or (None, key).
+    """
+    if CACHE is None:
+        return None, None
+    key = GraphKey(nodes, A, graphlet_nodes)
+    arrays = CACHE.load(key, 'GDV')
+    return (None if arrays is None else arrays['values']), key
+
+def store_GDV(key, GDV_arr):
+    if CACHE is not None and key is not None:
+        CACHE.store(key, 'GDV', GDV_arr)
+
+def load_GCV(nodes, A, graphlet_nodes=4):
+    """
+    Returns the cached GCV DataFrame of the graph and its key, or (None, key).
+    """
+    if CACHE is None:
+        return None, None
+    key = GraphKey(nodes, A, graphlet_nodes)
+    arrays = CACHE.load(key, 'GCV')
+    if arrays is None:
+        return None, key
+    columns = pd.MultiIndex.from_arrays(list(arrays['columns']),
+                                        names=list(arrays['names']))
+    return pd.DataFrame(arrays['values'], index=list(nodes),
+                                          columns=columns), key
+
+def store_GCV(key, GCV):
+    if CACHE is not None and key is not None:
+        columns = np.array(GCV.columns.tolist(), dtype=str).T
+        names   = np.array(GCV.columns.names, dtype=str)
+        CACHE.store(key, 'GCV', GCV.values, columns=columns, names=names)
@@ -0,0 +1,67 @@
+"""
+Condensed distance matrices with node labels.
+
+A symmetric (N,N) matrix with zero diagonal is stored as its upper triangle
+in the order of scipy's squareform, which halves the memory (and halves it
+again with dtype=np.float32).
+"""
+
+from scipy.spatial.distance import squareform
+
+import pandas as pd
+import numpy as np
+
+
+def condensed_index(i, j, N):
+    """
+    Positions of the entries (i,j), i<j, of an (N,N) matrix in its upper
+    triangle.
+    """
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    return N*i - i*(i+1)//2 + j - i - 1
+
+def condensed_rows(N, start, stop):
+    """
+    Position of the first entry of the upper triangle of every row from
+    start to stop; the rows' entries are contiguous.
+    """
+    return condensed_index(np.arange(start, stop), np.arange(start, stop)+1, N)
+
+
+class CondensedMatrix:
+    """
+    Upper triangle `values` of a symmetric matrix whose rows and columns are
+    labelled by `labels`.
+    """
+    def __init__(self, values, labels):
+        self.values = values
+        self.labels = pd.Index(labels)
+        if len(values) != len(labels)*(len(labels)-1)//2:
+            raise Exception(f"{len(values)} values don't fit "
+                            f"{len(labels)} labels!")
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def shape(self):
+        return (len(self.labels), len(self.labels))
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def __getitem__(self, key):
+        u, v = key
+        i, j = sorted((self.labels.get_loc(u), self.labels.get_loc(v)))
+        if i == j:
+            return self.values.dtype.type(0)
+        return self.values[condensed_index(i, j, len(self))]
+
+    def to_numpy(self):
+        return squareform(self.values, checks=False)
+
+    def to_frame(self):
+        return pd.DataFrame(self.to_numpy(), index   = self.labels,
+                                             columns = self.labels)
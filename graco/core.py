@@ -1,26 +1,29 @@
 from scipy.spatial.distance import cdist, pdist, squareform
+from graco.condensed import CondensedMatrix
 
 import ot
+import os
 import graco
 import scipy
+import scipy.stats
 import warnings
+import multiprocessing
 import numpy as np
 import pandas as pd
-import networkx as nx
 
 warnings.filterwarnings("error")
 
-def triangle_signature(G):
+def triangle_signature(G, labels=None, n_jobs=1):
     """
     Returns clustering coefficient and community coefficient.
+    G is a graph in any form accepted by graco.orbits.
     This function will ignore self-loops.
+    The triangles are counted in blocks of rows (by n_jobs processes)
+    without forming A@A, see graco.counting.triangle_counts.
     """
-    A = nx.to_scipy_sparse_matrix(G, format='lil')
-    A.setdiag(0)
-    A = scipy.sparse.csc_matrix(A)
-    A2 = A@A
-    o0 = A.sum(axis=1).A
-    numer = A.multiply(A2).sum(axis=1).A
+    A, _ = graco.functions.to_adjacency(G, labels)
+    o0 = np.diff(A.indptr).reshape(-1,1)
+    numer = 2*graco.counting.triangle_counts(A, n_jobs).reshape(-1,1)
 
     D_denom = o0*o0 - o0
     A_denom = A @o0 - o0
@@ -39,19 +42,57 @@ def GDV_to_GCM11(GDV):
     GCM11.loc['NULL'] = 1.
     return GCM11
 
+def GCM11(G):
+    return graco.gcm.GCM(graco.orbits(G, dtype=np.ndarray), orbits=11)
+
 def GCD11(G1, G2, metric='euclidean'):
-    GDV1, GDV2 = graco.orbits(G1)  , graco.orbits(G2)
-    GCM1 = squareform(GDV_to_GCM11(GDV1).corr(), checks=False)
-    GCM2 = squareform(GDV_to_GCM11(GDV2).corr(), checks=False)
-    return distance(GCM1,GCM2,metric)
+    return distance(GCM11(G1),GCM11(G2),metric)
 
-def emd(xs, xt, metric='euclidean', numItermax=2**17, **kwargs):
+def GDD(GDV):
+    """
+    Normalised graphlet degree distributions of all orbits of a GDV as a
+    Series indexed by (orbit, k): the number of nodes that touch the orbit
+    k>0 times, divided by k and normalised to unit sum per orbit.
+    """
+    X = np.asarray(GDV, dtype=np.int64)
+    n_orbits = X.shape[1]
+    keys = (X*n_orbits + np.arange(n_orbits)).ravel()
+    counts = pd.value_counts(keys[keys >= n_orbits], sort=False)
+    keys, counts = counts.index.to_numpy(), counts.to_numpy()
+    orbit, k = keys % n_orbits, keys // n_orbits
+
+    S = counts / k
+    T = np.bincount(orbit, S, minlength=n_orbits)
+    index = pd.MultiIndex.from_arrays([orbit, k], names=['Orbit', 'k'])
+    return pd.Series(S / T[orbit], index=index)
+
+def GDD_agreement(GDD1, GDD2, n_orbits=15, mean='arithmetic'):
+    """
+    Agreement of two normalised graphlet degree distributions, see GDD: the
+    arithmetic or geometric mean over all orbits of one minus their
+    Euclidean distance divided by sqrt(2).
+    """
+    diff = GDD1.sub(GDD2, fill_value=0)**2
+    distance = np.sqrt(np.bincount(diff.index.get_level_values(0), diff.values,
+                                   minlength=n_orbits))
+    agreement = 1 - distance/np.sqrt(2)
+    if   mean == 'arithmetic':
+        return agreement.mean()
+    elif mean == 'geometric':
+        return scipy.stats.gmean(agreement)
+    else:
+        raise Exception(f"Mean {mean} not known!")
 
-    if len(xs.shape) == 1:
-            xs = xs.reshape(-1,1)
-    if len(xt.shape) == 1:
-            xt = xt.reshape(-1,1)
+def GDDA(G1, G2, mean='arithmetic'):
+    """
+    Graphlet degree distribution agreement of two graphs, from 0 to 1 for
+    identical distributions. Linear in the number of nodes once the orbits
+    are counted, 1-GDDA is a cheap distance to screen networks.
+    """
+    return GDD_agreement(GDD(graco.orbits(G1)), GDD(graco.orbits(G2)),
+                         mean=mean)
 
+def _emd_dense(xs, xt, a, b, metric, numItermax, **kwargs):
     M  = cdist(xs,xt,metric)
 
     if (M == 0).all():
@@ -59,9 +100,6 @@ def emd(xs, xt, metric='euclidean', numItermax=2**17, **kwargs):
 
     M2 = M**2
 
-    a = np.ones(len(xs))/len(xs)
-    b = np.ones(len(xt))/len(xt)
-
     for i in range(3):
         try:
             F = ot.emd(a, b, M2, numItermax, **kwargs)
@@ -71,24 +109,224 @@ def emd(xs, xt, metric='euclidean', numItermax=2**17, **kwargs):
             numItermax = 2*numItermax
     assert False, "No conversion reached. Try to increase numItermax!"
 
-def triangle_distance(Gs, Gt, metric='euclidean'):
-    xs = np.nan_to_num(np.array(triangle_signature(Gs)).T)
-    xt = np.nan_to_num(np.array(triangle_signature(Gt)).T)
-    return emd(xs,xt, metric)
+# metrics of 1-D points that are powers of |x-y|
+POWER_1D = {'euclidean':1, 'cityblock':1, 'chebyshev':1, 'minkowski':1,
+            'sqeuclidean':2}
+
+def _emd_1d(xs, xt, metric, a=None, b=None):
+    """
+    EMD of two weighted 1-D point sets from their quantile functions, which
+    give the optimal transport plan of every convex cost.
+    """
+    if metric not in POWER_1D:
+        raise Exception(f"Metric {metric} not known for 1-D EMD!")
+    power = POWER_1D[metric]
+
+    a = np.ones(len(xs)) if a is None else np.asarray(a, dtype=float)
+    b = np.ones(len(xt)) if b is None else np.asarray(b, dtype=float)
+    order_s, order_t = np.argsort(xs), np.argsort(xt)
+    cs = np.cumsum(a[order_s]) / a.sum()
+    ct = np.cumsum(b[order_t]) / b.sum()
+
+    q = np.union1d(cs, ct)
+    lengths = np.diff(q, prepend=0.)
+    middle  = q - lengths/2
+    i = np.minimum(np.searchsorted(cs, middle), len(xs)-1)
+    j = np.minimum(np.searchsorted(ct, middle), len(xt)-1)
+    return np.sum(lengths * np.abs(xs[order_s][i] - xt[order_t][j])**power)
+
+def _emd_sliced(xs, xt, metric, n_projections, seed):
+    """
+    Mean 1-D EMD of the point sets projected onto random directions.
+    """
+    rng = np.random.RandomState(seed)
+    theta = rng.normal(size=(n_projections, xs.shape[1]))
+    theta /= np.linalg.norm(theta, axis=1, keepdims=True)
+    return np.mean([_emd_1d(xs@direction, xt@direction, metric)
+                                                for direction in theta])
+
+def _histogram(x, low, high, bins):
+    """
+    Occupied cells of a grid with `bins` cells per dimension, as the mean
+    point of every cell and its fraction of the points.
+    """
+    width = np.where(high > low, high - low, 1.)
+    cells = np.clip(np.floor((x-low)/width*bins), 0, bins-1).astype(np.int64)
+    keys  = np.ravel_multi_index(cells.T, (bins,)*x.shape[1])
+    _, inverse, counts = np.unique(keys, return_inverse   = True,
+                                         return_counts    = True)
+    centers = np.column_stack([np.bincount(inverse, x[:,k]) / counts
+                                            for k in range(x.shape[1])])
+    return centers, counts/len(x)
+
+def emd(xs, xt, metric='euclidean', numItermax=2**17, method='exact',
+        bins=32, n_projections=64, seed=None, **kwargs):
+    """
+    Earth mover's distance of two point sets with uniform weights.
+    method:
+        'exact'     Optimal transport on the dense cost matrix, or from the
+                    sorted points for 1-D signatures.
+        'sliced'    Sliced Wasserstein approximation with n_projections
+                    random directions, in O(N log N) memory and time.
+        'binned'    Exact EMD between histograms with `bins` cells per
+                    dimension, represented by the mean point of every cell.
+        'sinkhorn'  Entropic approximation, see graco.transport.sinkhorn,
+                    which receives kwargs. Raises a ConvergenceWarning if
+                    it stops at max_iter.
+    """
+    if len(xs.shape) == 1:
+            xs = xs.reshape(-1,1)
+    if len(xt.shape) == 1:
+            xt = xt.reshape(-1,1)
+
+    if   method == 'exact':
+        if xs.shape[1] == 1 and metric in POWER_1D:
+            return _emd_1d(xs[:,0], xt[:,0], metric)
+        a = np.ones(len(xs))/len(xs)
+        b = np.ones(len(xt))/len(xt)
+        return _emd_dense(xs, xt, a, b, metric, numItermax, **kwargs)
+    elif method == 'sliced':
+        return _emd_sliced(xs, xt, metric, n_projections, seed)
+    elif method == 'sinkhorn':
+        cost, log = graco.transport.sinkhorn(xs, xt, metric, **kwargs)
+        graco.transport._warn_unconverged(log)
+        return cost
+    elif method == 'binned':
+        low  = np.minimum(xs.min(axis=0), xt.min(axis=0))
+        high = np.maximum(xs.max(axis=0), xt.max(axis=0))
+        cs, a = _histogram(xs, low, high, bins)
+        ct, b = _histogram(xt, low, high, bins)
+        return _emd_dense(cs, ct, a, b, metric, numItermax, **kwargs)
+    else:
+        raise Exception(f"Method {method} not known!")
+
+def triangle_distance(Gs, Gt, metric='euclidean', method='exact', **kwargs):
+    """
+    EMD between the triangle signatures of two graphs, see emd for the
+    methods.
+    """
+    xs = network_signature(Gs, 'triangle')
+    xt = network_signature(Gt, 'triangle')
+    return emd(xs,xt, metric, method=method, **kwargs)
+
+def network_signature(G, method):
+    """
+    Signature of a graph that network_distance_matrix compares: the
+    (N,2) triangle signature points for 'triangle', the condensed GCM11 for
+    'GCD11' and the GDD for 'GDDA'.
+    """
+    if   method == 'triangle':
+        return np.nan_to_num(np.array(triangle_signature(G)).T)
+    elif method == 'GCD11':
+        return GCM11(G)
+    elif method == 'GDDA':
+        return GDD(graco.orbits(G))
+    else:
+        raise Exception(f"Method {method} not known!")
+
+_SIGNATURES = None
+
+# Upper bound on the (targets, N, M) entries of a batched Sinkhorn problem,
+# larger batches are slower than single problems once they leave the cache.
+SINKHORN_BATCH = 2**16
+
+def _init_signatures(signatures):
+    global _SIGNATURES
+    _SIGNATURES = signatures
+
+def _emd_pairs(pairs, metric, kwargs):
+    return [emd(_SIGNATURES[i], _SIGNATURES[j], metric, **kwargs)
+                                                        for i,j in pairs]
+
+def _sinkhorn_rows(rows, metric, kwargs):
+    """
+    Sinkhorn costs of every signature in rows against all later signatures,
+    solved in batches of up to SINKHORN_BATCH entries.
+    """
+    costs = []
+    for i in rows:
+        xs, batch = _SIGNATURES[i], []
+        for xt in _SIGNATURES[i+1:]:
+            batch.append(xt)
+            if len(batch)*len(xs)*max(map(len, batch)) >= SINKHORN_BATCH:
+                costs.append(_sinkhorn_batch(xs, batch, metric, kwargs))
+                batch = []
+        if batch:
+            costs.append(_sinkhorn_batch(xs, batch, metric, kwargs))
+    return np.concatenate([np.zeros(0)] + costs)
+
+def _sinkhorn_batch(xs, xts, metric, kwargs):
+    cost, log = graco.transport.sinkhorn(xs, xts, metric, **kwargs)
+    graco.transport._warn_unconverged(log)
+    return cost
+
+def network_distance_matrix(graphs, method='triangle', metric='euclidean',
+                            n_jobs=1, emd_method='exact', **kwargs):
+    """
+    Condensed distance matrix (see scipy's pdist) of a list or dict of graphs,
+    by triangle_distance for method='triangle', GCD11 for 'GCD11' or 1-GDDA
+    for 'GDDA'. The signature of every graph is computed once, n_jobs
+    processes (-1 for all cores) compute the signatures and the distances of
+    the pairs. emd_method is passed to emd as its method, together with
+    kwargs. With emd_method='sinkhorn', every graph is solved against the
+    later graphs in batched graco.sinkhorn calls.
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    graphs = list(graphs.values()) if type(graphs) == dict else list(graphs)
+
+    tasks = [(G, method) for G in graphs]
+    if n_jobs > 1:
+        with multiprocessing.Pool(n_jobs) as p:
+            signatures = p.starmap(network_signature, tasks)
+    else:
+        signatures = [network_signature(*task) for task in tasks]
+
+    if method == 'GDDA':
+        return np.array([1 - GDD_agreement(signatures[i], signatures[j])
+                            for i,j in zip(*np.triu_indices(len(graphs), 1))])
+    if method == 'GCD11':
+        if metric in ['GDV_similarity', 'hellinger', 'js_divergence']:
+            return squareform(distance_matrix(np.array(signatures), metric),
+                              checks=False)
+        return pdist(np.array(signatures), metric)
+
+    if emd_method == 'sinkhorn':
+        function, tasks = _sinkhorn_rows, np.arange(len(graphs)-1)
+    else:
+        function, tasks = _emd_pairs, np.column_stack(
+                                            np.triu_indices(len(graphs), 1))
+        kwargs = dict(kwargs, method=emd_method)
+    if n_jobs > 1:
+        shards = np.array_split(tasks, min(len(tasks), 4*n_jobs) or 1)
+        with multiprocessing.Pool(n_jobs, initializer = _init_signatures,
+                                          initargs    = (signatures,)) as p:
+            distances = p.starmap(function, [(shard, metric, kwargs)
+                                                        for shard in shards])
+        return np.concatenate([np.zeros(0)] + [np.array(d, dtype=float)
+                                                    for d in distances])
+    _init_signatures(signatures)
+    return np.array(function(tasks, metric, kwargs), dtype=float)
 
 def iter_equations(GCV):
-    lowest_two_levels = list(range(GCV.columns.nlevels-1))
-    for eq, coeffs in GCV.groupby(
-                                level = lowest_two_levels,
-                                axis  = 1):
+    for eq, coeffs in iter_equation_coefficients(GCV):
         yield eq
 
 def iter_equation_coefficients(GCV):
-    lowest_two_levels = list(range(GCV.columns.nlevels-1))
-    for eq, coeffs in GCV.groupby(
-                                level = lowest_two_levels,
-                                axis  = 1):
-        yield eq, coeffs
+    """
+    Yields every equation of a GCV DataFrame or GCVArray with its
+    coefficients as a DataFrame. The equations are contiguous column blocks of
+    the sorted GCV, so the DataFrames are built from views of a single array.
+    """
+    if not isinstance(GCV, graco.GCVArray):
+        GCV = graco.GCVArray.from_frame(GCV)
+    columns = GCV.columns
+    for n, (eq, coeffs) in enumerate(GCV.iter_equations()):
+        start, stop = GCV.offsets[n], GCV.offsets[n+1]
+        yield (eq[0] if len(eq) == 1 else eq), \
+              pd.DataFrame(coeffs, index   = GCV.index,
+                                   columns = columns[start:stop],
+                                   copy    = False)
 
 def _get_value(value, coeffs):
     if   value == 'barycenter':
@@ -140,7 +378,7 @@ def distance(u,v, metric):
         return graco.distances.js_divergence(u,v)
     else:
         u, v = np.array(u).flatten(), np.array(v).flatten()
-        return float(pdist([u,v], metric))
+        return float(pdist([u,v], metric)[0])
 
 def convex_distance(u,v,metric):
     """
@@ -157,71 +395,73 @@ def convex_distance(u,v,metric):
         return distance(u,v,metric) / normalizer(metric, len(u))
 
 
-def distance_matrix(M, metric):
+def distance_matrix(M, metric, condensed=False, dtype=np.float64, out=None,
+                                                           tile_size=None):
+    """
+    Pairwise distances of the rows of M. With condensed=True only the upper
+    triangle is returned, as graco.CondensedMatrix labelled by the rows.
+    With a filename `out`, the matrix is computed tile by tile into that
+    file and returned as np.memmap; an interrupted computation continues
+    where it stopped (see graco.distance_matrices.pairwise). tile_size is
+    the number of rows of a tile.
+    """
     if   metric == 'GDV_similarity':
-        return graco.distance_matrices.GDV_similarity(M)
+        return graco.distance_matrices.GDV_similarity(M, out       = out,
+                                                         condensed = condensed,
+                                                         dtype     = dtype,
+                                                         tile_size = tile_size)
     elif metric == 'hellinger':
-        return graco.distance_matrices.hellinger(M)
+        return graco.distance_matrices.hellinger(M, out       = out,
+                                                    condensed = condensed,
+                                                    dtype     = dtype,
+                                                    tile_size = tile_size)
     elif metric == 'js_divergence':
-        return graco.distance_matrices.js_divergence(M)
-    else:
-        return squareform(pdist(M, metric))
+        return graco.distance_matrices.js_divergence(M, out       = out,
+                                                        condensed = condensed,
+                                                        dtype     = dtype,
+                                                        tile_size = tile_size)
+    elif out is not None:
+        return graco.distance_matrices.pairwise(M, metric, out       = out,
+                                                           condensed = condensed,
+                                                           dtype     = dtype,
+                                                           tile_size = tile_size)
+    D = pdist(M, metric).astype(dtype, copy=False)
+    if not condensed:
+        return squareform(D)
+    labels = M.index if type(M) == pd.DataFrame else range(len(M))
+    return CondensedMatrix(D, labels)
 
 def GCV_distance(u, v, metric, nan='include'):
     gdv = pd.concat([u, v], axis=1).T.dropna(axis=1)
     return np.mean([convex_distance(u[eq], v[eq], metric)
                                                 for eq in iter_equations(gdv)])
 
-def GCV_distance_matrix(GCV, distance, nan='include'):
+def GCV_distance_matrix(GCV, distance, nan='include', condensed=False,
+                                         dtype=np.float64, n_jobs=1, out=None,
+                                         tile_size=None):
     """
     Calculates distances equation-wise with optional parameter to controll the
     behaviour of NaNs. Carefull with 'correlation-distances', since they require
     a positive variation in the coefficients within an equation.
+    GCV is a DataFrame or a GCVArray, the equations are computed together by
+    graco.distance_matrices.GCV_distance with n_jobs threads. With a filename
+    `out`, the matrix is computed out of core into that file and resumed from
+    its finished tiles if the computation is repeated. tile_size is the
+    number of rows of a tile.
     """
-    if nan == 'include':
-        if type(GCV.columns) == pd.MultiIndex:
-            D_all   = pd.DataFrame(0, index=GCV.index, columns=GCV.index)
-            Divisor = pd.DataFrame(0, index=GCV.index, columns=GCV.index)
-
-            for eq, coeffs in iter_equation_coefficients(GCV):
-                gcv = coeffs.dropna()
-                if gcv.empty:
-                    continue
-
-                not_nan_indices = gcv.index
-                nan_indices = GCV.index[coeffs.isna().any(axis=1)]
-
-                assert (coeffs.isna().any(axis=1) == coeffs.isna().all(axis=1)).all()
-                assert len(nan_indices) + len(not_nan_indices) == len(GCV)
-
-                D_sub = graco.distance_matrix(gcv, distance)
-                if distance == 'seuclidean':
-                    s1, s2 = sorted(gcv.var(ddof=1))[:2]
-                    d_max = np.sqrt(1/s1 +1/s2)
-                else:
-                    d_max = normalizer(distance,len(gcv.T))
-                D_all.loc[  not_nan_indices, not_nan_indices] += D_sub / d_max
-                Divisor.loc[not_nan_indices, not_nan_indices] += 1
-
-            return D_all / Divisor
-        else:
-            D = pd.DataFrame(np.nan, index   = GCV.index,
-                                     columns = GCV.index)
-            length = len(GCV.T)
-            gcv = GCV.dropna()
-            not_nan_indices = gcv.index
-            nan_indices = GCV.index[GCV.isna().any(axis=1)]
-
-            assert (GCV.isna().any(axis=1) == GCV.isna().all(axis=1)).all()
-            assert len(nan_indices) + len(not_nan_indices) == len(GCV)
-
-            D_sub = graco.distance_matrix(gcv, distance)
-            if distance == 'seuclidean':
-                s1, s2 = sorted(gcv.var(ddof=1))[:2]
-                d_max = np.sqrt(1/s1 +1/s2)
-            else:
-                d_max = normalizer(distance,length)
-            D.loc[not_nan_indices,not_nan_indices] = D_sub / d_max
-            return D
-    else:
+    if nan != 'include':
         raise Exception("Only 'nan=include' implemented yet!")
+
+    if   isinstance(GCV, graco.GCVArray):
+        pass
+    elif type(GCV.columns) == pd.MultiIndex:
+        GCV = graco.GCVArray.from_frame(GCV)
+    else:
+        GCV = graco.GCVArray(GCV.values, GCV.index,
+                             [(column,) for column in GCV.columns])
+    return graco.distance_matrices.GCV_distance(GCV, distance,
+                                                n_jobs    = n_jobs,
+                                                out       = out,
+                                                condensed = condensed,
+                                                dtype     = dtype,
+                                                tile_size = tile_size)
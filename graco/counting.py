@@ -0,0 +1,455 @@
+"""
+In-process counting of the 15 orbits of 2-4 node graphlets.
+
+The graph is given as a symmetric scipy sparse adjacency matrix. Orbit counts
+are obtained from non-induced counts (degrees, triangles, common neighbours)
+that only need sparse products on the adjacency matrix, and are then converted
+to induced counts with the overlap matrix OVERLAP4. Only 4-cliques are
+enumerated explicitly.
+"""
+
+import multiprocessing
+import scipy.sparse
+import numpy as np
+import os
+
+# Upper bound on the number of wedges expanded at once.
+WEDGE_BUDGET = 2**22
+
+# OVERLAP4[j-4, k-4]: number of non-induced copies of orbit k contained in the
+# induced graphlet of orbit j (at the same node), orbits 4 to 14.
+OVERLAP4 = np.array([
+    # 4  5  6  7  8  9 10 11 12 13 14
+    [ 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],   #  4
+    [ 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0],   #  5
+    [ 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0],   #  6
+    [ 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0],   #  7
+    [ 2, 2, 0, 0, 1, 0, 0, 0, 0, 0, 0],   #  8
+    [ 2, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0],   #  9
+    [ 1, 1, 1, 0, 0, 0, 1, 0, 0, 0, 0],   # 10
+    [ 0, 2, 0, 1, 0, 0, 0, 1, 0, 0, 0],   # 11
+    [ 4, 2, 2, 0, 1, 2, 2, 0, 1, 0, 0],   # 12
+    [ 2, 4, 1, 1, 1, 0, 2, 2, 0, 1, 0],   # 13
+    [ 6, 6, 3, 1, 3, 3, 6, 3, 3, 3, 1],   # 14
+], dtype=np.int64)
+
+
+def _binom2(x):
+    return x*(x-1)//2
+
+def _binom3(x):
+    return x*(x-1)*(x-2)//6
+
+def _row_sums(A):
+    return np.asarray(A.sum(axis=1), dtype=np.int64).ravel()
+
+
+def to_csr(A):
+    """
+    Returns a binary, symmetric int64 CSR matrix without self-loops and with
+    sorted indices. The input matrix is not modified.
+    """
+    A = scipy.sparse.coo_matrix(A)
+    mask = (A.row != A.col) & (A.data != 0)
+    A = scipy.sparse.csr_matrix((np.ones(mask.sum(), dtype=np.int64),
+                                 (A.row[mask], A.col[mask])), shape=A.shape)
+    A = ((A + A.T) != 0).astype(np.int64).tocsr()
+    A.sort_indices()
+    return A
+
+def edges_to_csr(edges, N):
+    """
+    CSR adjacency matrix as returned by to_csr of the N nodes and the (M,2)
+    array of edges between their positions.
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1,2)
+    return to_csr(scipy.sparse.coo_matrix((np.ones(len(edges), dtype=np.int64),
+                                           (edges[:,0], edges[:,1])),
+                                          shape=(N,N)))
+
+
+def _expand(indptr, begin, rows):
+    """
+    Returns the CSR slots from `begin[row]` to the end of every row in `rows`
+    together with the position of the owning row.
+    """
+    begin  = begin[rows]
+    counts = indptr[rows+1] - begin
+    owner  = np.repeat(np.arange(len(rows)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts,
+                                                 counts)
+    return np.repeat(begin, counts) + offset, owner
+
+def _chunks(nodes, cost, budget=WEDGE_BUDGET):
+    """
+    Splits `nodes` into consecutive chunks with a total `cost` of about
+    `budget` each.
+    """
+    if len(nodes) == 0:
+        return []
+    cumcost = np.cumsum(cost[nodes])
+    limits  = np.arange(budget, cumcost[-1], budget)
+    bounds  = np.unique(np.searchsorted(cumcost, limits, side='right'))
+    return np.split(nodes, bounds[(bounds > 0) & (bounds < len(nodes))])
+
+def _is_edge(keys, N, u, v):
+    # scipy keeps int32 indices, which would overflow in u*N
+    query = u.astype(np.int64)*N + v
+    pos = np.searchsorted(keys, query)
+    pos[pos == len(keys)] = 0
+    return keys[pos] == query if len(keys) else np.zeros(len(query), bool)
+
+
+class _Graph:
+    """
+    The arrays needed for counting, optionally backed by shared memory so
+    that worker processes can read them without copies. `T` receives the
+    number of triangles on every edge, aligned with the CSR slots.
+    """
+    def __init__(self, N, indptr, indices, order, upper_indptr, upper_indices,
+                       T):
+        self.N = N
+        self.A = scipy.sparse.csr_matrix((np.ones(len(indices), np.int64),
+                                          indices, indptr), shape=(N,N))
+        self.d = np.diff(indptr)
+        # upper triangle of the adjacency matrix with nodes sorted by degree
+        self.order = order
+        self.U = scipy.sparse.csr_matrix((np.ones(len(upper_indices),np.int64),
+                                          upper_indices, upper_indptr),
+                                         shape=(N,N))
+        self.keys = np.repeat(np.arange(N), np.diff(upper_indptr))*N \
+                                                            + upper_indices
+        self.T = T
+        self._E  = None
+        self._UT = None
+
+    @classmethod
+    def from_csr(cls, A, shared=False):
+        N = A.shape[0]
+        order = np.lexsort([np.arange(N), np.diff(A.indptr)])
+        U = scipy.sparse.triu(A[order][:,order], k=1, format='csr')
+        U.sort_indices()
+        arrays = [A.indptr, A.indices, order, U.indptr, U.indices,
+                  np.zeros(A.nnz)]
+        arrays = [np.asarray(array, dtype=np.int64) for array in arrays]
+        if not shared:
+            return cls(N, *arrays)
+        buffers = [_to_shared(array) for array in arrays]
+        graph = cls(N, *map(_from_shared, buffers))
+        graph.buffers = (N, *buffers)
+        return graph
+
+    @property
+    def E(self):
+        """
+        Sparse matrix with T-1 on every edge, built once T is complete.
+        """
+        if self._E is None:
+            self._E = scipy.sparse.csr_matrix((self.T-1, self.A.indices,
+                                                         self.A.indptr),
+                                              shape=(self.N,self.N))
+        return self._E
+
+    @property
+    def UT(self):
+        """
+        CSR transpose of U, built once per process.
+        """
+        if self._UT is None:
+            self._UT = self.U.T.tocsr()
+        return self._UT
+
+
+def _to_shared(array):
+    buffer = multiprocessing.RawArray('q', len(array))
+    _from_shared(buffer)[:] = array
+    return buffer
+
+def _from_shared(buffer):
+    return np.frombuffer(buffer, dtype=np.int64)
+
+
+# Every phase works on a block of rows and only reads the graph, apart from
+# the triangle counts of the block's own edges.
+
+def _common_neighbour_phase(graph, rows):
+    """
+    Writes the triangle counts of the edges of `rows` into graph.T and returns
+    the non-induced counts of orbit 8 (4-cycles) at `rows`.
+    """
+    A, d = graph.A, graph.d
+    P = A[rows] @ A
+    S = A[rows].multiply(P) + A[rows]
+    S.sort_indices()
+    graph.T[A.indptr[rows[0]]:A.indptr[rows[-1]+1]] = S.data - 1
+    P.data = _binom2(P.data)
+    return _row_sums(P) - _binom2(d[rows])
+
+def _diamond_phase(graph, rows):
+    """
+    Returns the non-induced counts of orbit 12 at `rows`.
+    """
+    A = graph.A
+    return _row_sums(A[rows].multiply(A[rows] @ graph.E)) // 2
+
+def _clique_phase(graph, rows):
+    """
+    Lists every 4-clique once, starting at the node of lowest degree in
+    `rows`, and returns the number of cliques at every node.
+    """
+    N, U, keys = graph.N, graph.U, graph.keys
+    indptr, indices = U.indptr, U.indices
+
+    ab, owner = _expand(indptr, indptr[:-1], rows)
+    a, b = rows[owner], indices[ab]
+    bc, wedge = _expand(indptr, indptr[:-1], b)
+    a, b, c = a[wedge], b[wedge], indices[bc]
+    mask = _is_edge(keys, N, a, c)
+    a, b, c = a[mask], b[mask], c[mask]
+
+    cx, tri = _expand(indptr, indptr[:-1], c)
+    a, b, c, x = a[tri], b[tri], c[tri], indices[cx]
+    mask = _is_edge(keys, N, a, x)
+    a, b, c, x = a[mask], b[mask], c[mask], x[mask]
+    mask = _is_edge(keys, N, b, x)
+
+    counts = np.zeros(N, dtype=np.int64)
+    for node in (a, b, c, x):
+        counts += np.bincount(node[mask], minlength=N)
+    counts[graph.order] = counts.copy()
+    return counts
+
+def _triangle_phase(graph, rows):
+    """
+    Finds every triangle a<b<c of U once, from a and c in U@U and from b in
+    U.T@U, for a or b in `rows`, and returns the number of triangles at every
+    node.
+    """
+    U = graph.U
+    W = U[rows]
+    M = (W @ U).multiply(W).tocoo()
+    counts = np.bincount(M.col, M.data, minlength=graph.N).astype(np.int64)
+    counts[rows] += np.bincount(M.row, M.data, minlength=len(rows)
+                                                        ).astype(np.int64)
+    counts[rows] += _row_sums((graph.UT[rows] @ U).multiply(W))
+    counts[graph.order] = counts.copy()
+    return counts
+
+
+_GRAPH = None
+
+def _init_worker(N, *buffers):
+    global _GRAPH
+    _GRAPH = _Graph(N, *map(_from_shared, buffers))
+
+def _run_phase(phase, rows):
+    return phase(_GRAPH, rows)
+
+
+def orbit_counts(A, n_jobs=1, nodes=None, degrees=None):
+    """
+    Counts the 15 node orbits of 2-4 node graphlets for every node of the
+    graph with adjacency matrix A and returns them as an (N,15) int64 array.
+    The numbering of the orbits is the one of ORCA.
+
+    With n_jobs > 1 (or n_jobs=-1 for all cores), the nodes are split into
+    shards that are counted by a pool of processes sharing the adjacency
+    arrays. The result is the same as with n_jobs=1.
+
+    With `nodes`, only the rows of these node positions are counted, at a
+    cost that depends on their neighbourhoods instead of the whole graph.
+    A may then be a subgraph that contains the ball of radius 2 around the
+    nodes, given the `degrees` of its nodes in the whole graph.
+    """
+    return induced_counts(non_induced_counts(A, n_jobs=n_jobs, nodes=nodes,
+                                                degrees=degrees))
+
+
+def triangle_counts(A, n_jobs=1):
+    """
+    Number of triangles at every node as an int64 array. The triangles are
+    listed in blocks of rows of the degree-ordered upper triangle, so the
+    memory stays close to O(E) even for graphs with large hubs, and the
+    blocks are shared out to n_jobs processes like in non_induced_counts.
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    A = to_csr(A)
+    N = A.shape[0]
+    graph = _Graph.from_csr(A, shared = n_jobs > 1)
+    out_degree = np.diff(graph.U.indptr)
+    cost = graph.U @ out_degree + graph.UT @ out_degree
+    shards = _chunks(np.arange(N), cost, min(WEDGE_BUDGET,
+                                             cost.sum() // (4*n_jobs) + 1))
+
+    if n_jobs > 1:
+        with multiprocessing.Pool(n_jobs, initializer = _init_worker,
+                                          initargs    = graph.buffers) as p:
+            counts = p.starmap(_run_phase, [(_triangle_phase, rows)
+                                                        for rows in shards])
+    else:
+        counts = [_triangle_phase(graph, rows) for rows in shards]
+    return sum(counts, np.zeros(N, dtype=np.int64))
+
+def three_node_orbit_counts(A, n_jobs=1):
+    """
+    Counts the orbits 0-3 (degree, paths and triangles) and returns them as
+    an (N,4) int64 array. Only needs the triangles, see triangle_counts.
+    """
+    A = to_csr(A)
+    d = np.diff(A.indptr).astype(np.int64)
+    t = triangle_counts(A, n_jobs)
+    return np.column_stack([d, A @ (d-1) - 2*t, _binom2(d) - t, t])
+
+
+def non_induced_counts(A, n_jobs=1, nodes=None, degrees=None):
+    """
+    Counts the non-induced copies of the 15 orbits at every node, i.e. every
+    subgraph with the edges of the orbit's graphlet, whether or not further
+    edges are present among its nodes. Returns an (N,15) int64 array, or a
+    row for every node of `nodes` (see local_non_induced_counts).
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    A = to_csr(A)
+    if nodes is not None:
+        return local_non_induced_counts(A, nodes, degrees)
+    N = A.shape[0]
+    d = np.diff(A.indptr).astype(np.int64)
+    nodes = np.arange(N)
+    graph = _Graph.from_csr(A, shared = n_jobs > 1)
+
+    cost  = A @ d
+    budget = min(WEDGE_BUDGET, cost.sum() // (4*n_jobs) + 1)
+    shards = _chunks(nodes, cost, budget)
+    upper_cost = graph.U @ np.diff(graph.U.indptr)
+    upper_shards = _chunks(nodes, upper_cost, min(WEDGE_BUDGET,
+                                            upper_cost.sum() // (4*n_jobs) + 1))
+
+    if n_jobs > 1:
+        with multiprocessing.Pool(n_jobs, initializer = _init_worker,
+                                          initargs    = graph.buffers) as p:
+            n8  = p.starmap(_run_phase, [(_common_neighbour_phase, rows)
+                                                        for rows in shards])
+            n12 = p.starmap(_run_phase, [(_diamond_phase, rows)
+                                                        for rows in shards])
+            n14 = p.starmap(_run_phase, [(_clique_phase, rows)
+                                                  for rows in upper_shards])
+    else:
+        n8  = [_common_neighbour_phase(graph, rows) for rows in shards]
+        n12 = [_diamond_phase(graph, rows)          for rows in shards]
+        n14 = [_clique_phase(graph, rows)           for rows in upper_shards]
+
+    n8  = np.concatenate([np.zeros(0, np.int64)] + n8)
+    n12 = np.concatenate([np.zeros(0, np.int64)] + n12)
+    n14 = np.sum([np.zeros(N, np.int64)] + n14, axis=0)
+
+    return _assemble(A, d, graph.T, None, n8, n12, n14)
+
+
+def local_non_induced_counts(A, nodes, degrees=None):
+    """
+    Non-induced counts of the nodes `nodes` only. Every graphlet of a node
+    lies within distance 3 of it, and its counts only need the degrees of
+    this ball plus the triangles on the edges of the node's neighbours.
+    Counting therefore works on the subgraph induced by the ball of radius 2
+    around the nodes, with the common neighbour and clique phases limited to
+    the ball of radius 1. A is a CSR matrix as returned by to_csr, either of
+    the whole graph or of a subgraph containing that ball together with the
+    `degrees` of its nodes in the whole graph.
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    if len(nodes) == 0:
+        return np.zeros((0,15), dtype=np.int64)
+    if degrees is None:
+        d = np.diff(A.indptr).astype(np.int64)
+    else:
+        d = np.asarray(degrees, dtype=np.int64)
+    ball1 = np.union1d(nodes, A[nodes].indices)
+    ball2 = np.union1d(ball1, A[ball1].indices)
+    # the nodes of ball1 come first, so that their CSR rows are contiguous
+    order = np.concatenate([ball1, np.setdiff1d(ball2, ball1)])
+    H = A[order][:,order]
+    H.sort_indices()
+    graph = _Graph.from_csr(H)
+
+    inner = np.arange(len(ball1))
+    rows  = np.searchsorted(ball1, nodes)
+    cost  = H @ d[order]
+    n8 = np.concatenate([np.zeros(0, np.int64)] +
+                        [_common_neighbour_phase(graph, chunk)
+                                        for chunk in _chunks(inner, cost)])
+    n12 = np.concatenate([np.zeros(0, np.int64)] +
+                         [_diamond_phase(graph, chunk)
+                                        for chunk in _chunks(rows, cost)])
+    rank = np.argsort(graph.order)
+    upper_rows = np.sort(rank[inner])
+    upper_cost = np.zeros(len(order), dtype=np.int64)
+    upper_cost[upper_rows] = (graph.U @ np.diff(graph.U.indptr))[upper_rows]
+    n14 = np.sum([np.zeros(len(order), np.int64)] +
+                 [_clique_phase(graph, chunk)
+                                for chunk in _chunks(upper_rows, upper_cost)],
+                 axis=0)
+
+    return _assemble(H, d[order], graph.T, rows, n8[rows], n12, n14[rows])
+
+
+def _assemble(A, d, T, rows, n8, n12, n14):
+    """
+    Non-induced counts at `rows` (None for all) from the degrees d, the
+    triangles T on every edge, aligned with A.data, and the counts of the
+    phases. d and T only need to be correct for the rows and their
+    neighbours.
+    """
+    E = A.copy()
+    E.data = T
+    t = _row_sums(E) // 2
+    n1 = A @ (d-1)
+
+    if rows is not None:
+        A, E = A[rows], E[rows]
+    T_rows = E.data.copy()
+    degrees = d if rows is None else d[rows]
+    t_rows  = t if rows is None else t[rows]
+    n1_rows = n1 if rows is None else n1[rows]
+
+    E.data = T_rows*(d[E.indices]-2)
+    n10 = _row_sums(E)
+    E.data = _binom2(T_rows)
+    n13 = _row_sums(E)
+
+    return np.column_stack([
+        degrees,                                    #  0
+        n1_rows,                                    #  1
+        _binom2(degrees),                           #  2
+        t_rows,                                     #  3
+        A @ n1 - degrees*(degrees-1) - 2*t_rows,    #  4
+        (degrees-1)*n1_rows - 2*t_rows,             #  5
+        A @ _binom2(d-1),                           #  6
+        _binom3(degrees),                           #  7
+        n8,                                         #  8
+        A @ t - 2*t_rows,                           #  9
+        n10,                                        # 10
+        t_rows*(degrees-2),                         # 11
+        n12,                                        # 12
+        n13,                                        # 13
+        n14,                                        # 14
+    ])
+
+
+def induced_counts(non_induced):
+    """
+    Converts non-induced orbit counts into induced ones. Works for integer
+    counts as well as for (float) estimates.
+    """
+    GDV = np.zeros_like(non_induced)
+    t = non_induced[:,3]
+    GDV[:,0] = non_induced[:,0]
+    GDV[:,1] = non_induced[:,1] - 2*t
+    GDV[:,2] = non_induced[:,2] - t
+    GDV[:,3] = t
+    for k in reversed(range(11)):
+        GDV[:,4+k] = non_induced[:,4+k] - GDV[:,4+k+1:] @ OVERLAP4[k+1:,k]
+    return GDV
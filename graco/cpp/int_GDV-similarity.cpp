@@ -1,154 +1,105 @@
-#include <iostream>
-#include <fstream>
-#include <numeric>
-#include <cmath>
-#include <array>
-#include <fstream>
-
-/*
-==================================
-  Functions and global variables
-==================================
-*/
-
-// Functions
-int init(int argc, char const *argv[]);
-double* get_weights();
-double** signature_similarity4(unsigned long long int GDV[][15], int m);
-void write_results(double** D, int m);
-
-// Global variables
-using std::fstream;
-fstream fin, fout;
-
-
-/*
-=================================
-              main
-=================================
-*/
-int main(int argc, char const *argv[]) {
-
-// import file
-  if (!init(argc, argv)) {
-		std::cerr << "Stopping!" << '\n';
-		return 0;
-	}
-
-// read matrix in
-  char c;
-  int m, n;
-  fin >> c >> m >> n;
-// assert c == '#'
-// assert n == 15
-  unsigned long long int GDV[m][15];
-  for (auto i = 0; i < m; i++) {
-    for (auto j = 0; j < n; j++) {
-      fin >> GDV[i][j];
-    }
-  }
-
-  double** D = signature_similarity4(GDV, m);
-  write_results(D, m);
-
-  return 0;
-}
-
-
-/*
-=================
-  init function
-=================
-*/
-int init(int argc, char const *argv[]) {
-// open input and output files
-	if (argc!=3) {
-		std::cerr << "Incorrect number of arguments." << '\n';
-		std::cerr << "Usage: tijana.exe [GDV matrix - input file] "
-                 "[similarity matrix - output file]" << '\n';
-		return 0;
-	}
-
-	fin.open(argv[1], fstream::in);
-	fout.open(argv[2], fstream::out | fstream::binary);
-	if (fin.fail()) {
-		std::cerr << "Failed to open file " << argv[1] << '\n';
-		return 0;
-	}
-	if (fout.fail()) {
-		std::cerr << "Failed to open file " << argv[2] << '\n';
-		return 0;
-	}
-  return 1;
-}
-
-/*
-======================
-  Calculate weights
-======================
-*/
-double* get_weights() {
-  static double WEIGHTS[15] = {1,2,2,2,3,4,3,3,4,3,4,4,4,4,3};
-  for (auto i = 0; i < 15; i++)
-    WEIGHTS[i] = 1 - std::log(WEIGHTS[i]) / std::log(15);
-  return WEIGHTS;
-}
-
-
-/*
-=========================
-  signature_similarity4
-=========================
-*/
-
-// Calculate log_GDV
-double** signature_similarity4(unsigned long long int GDV[][15], int m) {
-
-  double logGDV[m][15];
-  for (auto i = 0; i < m; i++) {
-    for (auto j = 0; j < 15; j++) {
-      logGDV[i][j] = std::log(GDV[i][j]+1);
-    }
-  }
-
-// Create empty distance matrix
-  double **D = new double*[m];
-  for(auto i = 0; i < m; ++i)
-    D[i] = new double[m];
-
-  double* WEIGHTS = get_weights();
-  double WEIGHT_SUM = 0;
-
-  for (auto i = 0; i < 15; i++) {
-    WEIGHT_SUM += WEIGHTS[i];
-  }
-
-  double sum = 0;
-  for (auto u = 0; u < m; u++) {
-    for (auto v = u+1; v < m; v++) {
-      sum = 0;
-      for (auto i = 0; i < 15; i++) {
-        sum += WEIGHTS[i] * std::abs(logGDV[u][i] - logGDV[v][i]) /
-              std::log(std::max(GDV[u][i], GDV[v][i])+2);
-      }
-      D[u][v] = sum/WEIGHT_SUM;
-      D[v][u] = D[u][v];
-    }
-  }
-  return D;
-}
-
-
-/*
-=================
-  write_results
-=================
-*/
-void write_results(double** D, int m){
-  for (auto i=0;i<m;i++) {
-		for (auto j=0;j<m;j++)
-			fout << D[i][j] << ' ';
-    fout << '\n';
-	}
-	fout.close();
-}
+#include <cmath>
+#include <vector>
+#include <algorithm>
+#include "matrix_io.hpp"
+
+/*
+==================================
+  Functions and global variables
+==================================
+*/
+
+// Functions
+double* get_weights(int n);
+void signature_similarity(const uint64_t* GDV, int64_t m, int64_t n,
+                          double* D);
+
+
+/*
+=================================
+              main
+=================================
+*/
+int main(int argc, char const *argv[]) {
+
+// map matrices
+  Matrix in, out;
+  if (!init_matrices(argc, argv, "int_GDV-similarity", in, out)) {
+		std::cerr << "Stopping!" << '\n';
+		return 1;
+	}
+  if (std::strcmp(in.dtype, "<i8") != 0 && std::strcmp(in.dtype, "<u8") != 0) {
+    std::cerr << "Input has to be int64 or uint64, not " << in.dtype << '\n';
+    return 1;
+  }
+
+  const int64_t m = in.rows, n = in.cols;
+  if (n != 15 && n != 73) {
+    std::cerr << "Number of orbits has to be 15 or 73, not " << n << '\n';
+    return 1;
+  }
+
+  signature_similarity(static_cast<const uint64_t*>(in.data), m, n,
+                       static_cast<double*>(out.data));
+  return 0;
+}
+
+
+/*
+======================
+  Calculate weights
+======================
+*/
+
+// number of orbits that affect every orbit (Milenkovic and Przulj, 2008)
+double* get_weights(int n) {
+  static const double ORBIT_DEPENDENCIES[73] = {
+    1,2,2,2,3,4,3,3,4,3,4,4,4,4,3,
+    4,6,5,4,5,6,6,4,4,4,5,7,4,6,6,7,4,6,6,6,
+    5,6,7,7,5,7,6,7,6,5,5,6,8,7,6,6,8,6,9,5,
+    6,4,6,6,7,8,6,6,8,7,6,7,7,8,5,6,6,4};
+
+  double* WEIGHTS = new double[n];
+  for (auto i = 0; i < n; i++)
+    WEIGHTS[i] = 1 - std::log(ORBIT_DEPENDENCIES[i]) / std::log(n);
+  return WEIGHTS;
+}
+
+
+/*
+========================
+  signature_similarity
+========================
+*/
+
+// Writes the (m,m) distance matrix of the (m,n) GDV into D
+void signature_similarity(const uint64_t* GDV, int64_t m, int64_t n,
+                          double* D) {
+// Calculate log_GDV
+  std::vector<double> logGDV(m*n);
+  for (int64_t i = 0; i < m*n; i++) {
+    logGDV[i] = std::log(GDV[i]+1);
+  }
+
+  double* WEIGHTS = get_weights(n);
+  double WEIGHT_SUM = 0;
+
+  for (auto i = 0; i < n; i++) {
+    WEIGHT_SUM += WEIGHTS[i];
+  }
+
+  double sum = 0;
+  for (int64_t u = 0; u < m; u++) {
+    D[u*m+u] = 0;
+    for (int64_t v = u+1; v < m; v++) {
+      sum = 0;
+      for (int64_t i = 0; i < n; i++) {
+        sum += WEIGHTS[i] * std::abs(logGDV[u*n+i] - logGDV[v*n+i]) /
+              std::log(std::max(GDV[u*n+i], GDV[v*n+i])+2);
+      }
+      D[u*m+v] = sum/WEIGHT_SUM;
+      D[v*m+u] = D[u*m+v];
+    }
+  }
+  delete[] WEIGHTS;
+}
@@ -1,56 +1,9 @@
-#include <iostream>
-#include <fstream>
-#include <numeric>
 #include <cmath>
-#include <array>
-#include <fstream>
-#include <cstdlib>
-#include <algorithm>
+#include "matrix_io.hpp"
 
 // Global variables
 const double _LOG2 = 0.69314718055;
 
-using std::fstream;
-fstream fin, fout;
-
-
-/*
-==================================
-  Functions and global variables
-==================================
-*/
-
-// Functions
-double* get_weights();
-void write_results(double** D, int m);
-
-/*
-=================
-  init function
-=================
-*/
-int init(int argc, char const *argv[]) {
-// open input and output files
-	if (argc!=3) {
-		std::cerr << "Incorrect number of arguments." << '\n';
-		std::cerr << "Usage: hellinger [input file] "
-                 "[output file]" << '\n';
-		return 0;
-	}
-
-	fin.open(argv[1], fstream::in);
-	fout.open(argv[2], fstream::out | fstream::binary);
-	if (fin.fail()) {
-		std::cerr << "Failed to open file " << argv[1] << '\n';
-		return 0;
-	}
-	if (fout.fail()) {
-		std::cerr << "Failed to open file " << argv[2] << '\n';
-		return 0;
-	}
-  return 1;
-}
-
 
 /*
 =================================
@@ -59,43 +12,35 @@ int init(int argc, char const *argv[]) {
 */
 int main(int argc, char const *argv[]) {
 
-// import file
-  if (!init(argc, argv)) {
+// map matrices
+  Matrix in, out;
+  if (!init_matrices(argc, argv, "js_divergence", in, out)) {
 		std::cerr << "Stopping!" << '\n';
-		return 0;
+		return 1;
 	}
-
-// read matrix in
-  char c;
-  int m, n;
-  fin >> c >> m >> n;
-  double GDV[m][n];
-  for (auto i = 0; i < m; i++) {
-    for (auto j = 0; j < n; j++) {
-      fin >> GDV[i][j];
-    }
+  if (std::strcmp(in.dtype, "<f8") != 0) {
+    std::cerr << "Input has to be float64, not " << in.dtype << '\n';
+    return 1;
   }
 
+  const int64_t m = in.rows, n = in.cols;
+  const double* P = static_cast<const double*>(in.data);
+  double* D = static_cast<double*>(out.data);
+
   /*
   =============================
     Calculate distance matrix
   =============================
   */
 
-  // Create empty distance matrix
-  double **D = new double*[m];
-  for(auto i = 0; i < m; ++i)
-    D[i] = new double[m];
-
-
-
   double sum = 0;
-  for (auto u = 0; u < m; u++) {
-    for (auto v = u+1; v < m; v++) {
+  for (int64_t u = 0; u < m; u++) {
+    D[u*m+u] = 0;
+    for (int64_t v = u+1; v < m; v++) {
       sum = 0;
-      for (auto i = 0; i < n; i++) {
-				double p_i = GDV[u][i];
-				double q_i = GDV[v][i];
+      for (int64_t i = 0; i < n; i++) {
+				double p_i = P[u*n+i];
+				double q_i = P[v*n+i];
 				double m_i = (p_i+q_i)/2;
 
 				double p_log = 0;
@@ -106,26 +51,10 @@ int main(int argc, char const *argv[]) {
 				sum += (p_i*p_log + q_i*q_log)/2;
       }
 
-      D[u][v] = sum / _LOG2;
-      D[v][u] = D[u][v];
+      D[u*m+v] = sum / _LOG2;
+      D[v*m+u] = D[u*m+v];
     }
   }
 
-  write_results(D, m);
-
   return 0;
 }
-
-/*
-=================
-  write_results
-=================
-*/
-void write_results(double** D, int m){
-  for (auto i=0;i<m;i++) {
-		for (auto j=0;j<m;j++)
-			fout << D[i][j] << ' ';
-    fout << '\n';
-	}
-	fout.close();
-}
@@ -0,0 +1,94 @@
+/*
+=====================================================
+  Binary matrix files shared with graco.distance_matrices
+=====================================================
+
+Every file starts with a 64 byte header:
+    char    magic[8]    "GRACOMAT"
+    char    dtype[8]    numpy dtype string, e.g. "<f8", zero padded
+    int64_t rows
+    int64_t cols
+    (zero padding up to 64 bytes)
+followed by the row-major data. Both files are memory-mapped: the input is
+read in place and the results are written straight into the output file,
+which the caller creates with its final size.
+*/
+
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <cstdint>
+#include <cstring>
+#include <iostream>
+
+const size_t HEADER_SIZE = 64;
+
+struct Matrix {
+  char dtype[9];
+  int64_t rows;
+  int64_t cols;
+  void* data;
+};
+
+// Maps the file and returns 0 on failure.
+int map_matrix(const char* filename, Matrix& M, bool writable) {
+  int fd = open(filename, writable ? O_RDWR : O_RDONLY);
+  if (fd < 0) {
+    std::cerr << "Failed to open file " << filename << '\n';
+    return 0;
+  }
+  struct stat st;
+  fstat(fd, &st);
+  if ((size_t) st.st_size < HEADER_SIZE) {
+    std::cerr << "File " << filename << " has no header." << '\n';
+    close(fd);
+    return 0;
+  }
+
+  void* base = mmap(nullptr, st.st_size,
+                    writable ? PROT_READ | PROT_WRITE : PROT_READ,
+                    MAP_SHARED, fd, 0);
+  close(fd);
+  if (base == MAP_FAILED) {
+    std::cerr << "Failed to map file " << filename << '\n';
+    return 0;
+  }
+
+  const char* header = static_cast<const char*>(base);
+  if (std::memcmp(header, "GRACOMAT", 8) != 0) {
+    std::cerr << "File " << filename << " is not a graco matrix." << '\n';
+    return 0;
+  }
+  std::memcpy(M.dtype, header+8, 8);
+  M.dtype[8] = '\0';
+  std::memcpy(&M.rows, header+16, 8);
+  std::memcpy(&M.cols, header+24, 8);
+  M.data = static_cast<char*>(base) + HEADER_SIZE;
+
+  size_t item_size = M.dtype[2] - '0';
+  if ((size_t) st.st_size < HEADER_SIZE + item_size*M.rows*M.cols) {
+    std::cerr << "File " << filename << " is too small." << '\n';
+    return 0;
+  }
+  return 1;
+}
+
+// Maps the input and the (m,m) float64 output matrix of a tool.
+int init_matrices(int argc, char const *argv[], const char* usage,
+                  Matrix& in, Matrix& out) {
+  if (argc!=3) {
+    std::cerr << "Incorrect number of arguments." << '\n';
+    std::cerr << "Usage: " << usage << " [input file] [output file]" << '\n';
+    return 0;
+  }
+  if (!map_matrix(argv[1], in, false) || !map_matrix(argv[2], out, true))
+    return 0;
+  if (std::strcmp(out.dtype, "<f8") != 0 ||
+      out.rows != in.rows || out.cols != in.rows) {
+    std::cerr << "Output has to be a float64 matrix of shape ("
+              << in.rows << "," << in.rows << ")." << '\n';
+    return 0;
+  }
+  return 1;
+}
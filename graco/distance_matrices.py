@@ -1,7 +1,13 @@
-from scipy.spatial.distance import pdist, squareform
+from scipy.spatial.distance import cdist, squareform
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from scipy.special import xlogy
+from graco.condensed import CondensedMatrix, condensed_rows
 import pandas as pd
 import numpy as np
 import subprocess
+import threading
+import hashlib
 import random
 import time
 import graco
@@ -11,6 +17,29 @@ GRACO_PATH = os.path.dirname(graco.__file__)
 CPP_PATH = f"{GRACO_PATH}/cpp"
 TMP_PATH = f"{GRACO_PATH}/tmp"
 
+# The C++ tools are not distributed as binaries, `make -C graco/cpp` builds
+# them for the current machine.
+CPP_TOOLS = ['hellinger', 'int_GDV-similarity', 'js_divergence']
+
+# Binary matrix files of the C++ tools are placed in shared memory if
+# available, see cpp/matrix_io.hpp for their format.
+SHM_PATH = "/dev/shm"
+HEADER_SIZE = 64
+
+# Upper bound on the number of (node, node, feature) entries of a tile if
+# no tile_size is given.
+TILE_ELEMENTS = 2**22
+
+# Matrices computed with a filename `out` are written tile by tile into that
+# binary matrix file. The row ranges of the finished tiles are appended to
+# the manifest f"{out}{MANIFEST_SUFFIX}", so that an interrupted computation
+# continues with the missing tiles when it is started again. Its first line
+# identifies the computation by the metric and a hash of the input. Finished tiles
+# are flushed to the file and recorded in batches of FLUSH_BYTES written
+# bytes, since every flush writes back the pages of all tiles in the batch.
+MANIFEST_SUFFIX = ".tiles"
+FLUSH_BYTES = 2**28
+
 def _get_timestamp():
     return time.time()*random.random()
 
@@ -22,68 +51,413 @@ def run_cmd(cmd):
         raise subprocess.CalledProcessError(cmd = cmd,
                     returncode = completed_process.returncode)
 
-def write_matrix(filename, M, fmt):
-    np.savetxt(filename,
-               M,
-               header=' '.join(map(str,M.shape)),
-               fmt=fmt)
+def cpp_available(tools=CPP_TOOLS):
+    """
+    Whether the C++ tools are built and can be executed on this machine.
+    """
+    for tool in tools:
+        try:
+            subprocess.run([f"{CPP_PATH}/{tool}"], stdout=subprocess.DEVNULL,
+                                                   stderr=subprocess.DEVNULL)
+        except OSError:
+            return False
+    return True
 
+def _header(shape, dtype):
+    shape = tuple(shape) + (1,)*(2-len(shape))
+    header = bytearray(HEADER_SIZE)
+    header[:8]   = b'GRACOMAT'
+    header[8:8+len(dtype.str)] = dtype.str.encode()
+    header[16:32] = np.array(shape, dtype='<i8').tobytes()
+    return bytes(header)
 
-def GDV_similarity(M):
-    if type(M) == pd.DataFrame:
-        M = M.values
-    if M.dtype == int:
-        timestamp = _get_timestamp()
-        matrix_in  = f"{TMP_PATH}/{timestamp}.in"
-        matrix_out = f"{TMP_PATH}/{timestamp}.out"
-        write_matrix(matrix_in, M, fmt='%d')
-        cmd = [f"{CPP_PATH}/int_GDV-similarity", matrix_in, matrix_out]
-        run_cmd(cmd)
-        D_arr = np.loadtxt(matrix_out)
+def create_matrix(filename, shape, dtype=np.float64):
+    """
+    Creates a binary matrix file of the C++ tools (see cpp/matrix_io.hpp)
+    and returns its data as a writable np.memmap.
+    """
+    dtype = np.dtype(dtype)
+    with open(filename, 'wb') as f:
+        f.write(_header(shape, dtype))
+        f.truncate(HEADER_SIZE + dtype.itemsize*int(np.prod(shape)))
+    return np.memmap(filename, dtype  = dtype,
+                               mode   = 'r+',
+                               offset = HEADER_SIZE,
+                               shape  = tuple(shape))
+
+def open_matrix(filename, shape, dtype=np.float64):
+    """
+    Opens a binary matrix file as writable np.memmap if it holds a matrix
+    of the given shape and dtype, returns None otherwise.
+    """
+    dtype = np.dtype(dtype)
+    if not os.path.exists(filename) or os.path.getsize(filename) != \
+                        HEADER_SIZE + dtype.itemsize*int(np.prod(shape)):
+        return None
+    with open(filename, 'rb') as f:
+        if f.read(HEADER_SIZE) != _header(shape, dtype):
+            return None
+    return np.memmap(filename, dtype  = dtype,
+                               mode   = 'r+',
+                               offset = HEADER_SIZE,
+                               shape  = tuple(shape))
+
+def _fingerprint(metric, *arrays):
+    """
+    First line of a manifest: the metric and a SHA-256 hash of the arrays
+    the matrix is computed from.
+    """
+    sha = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        sha.update(f"{array.dtype.str} {array.shape}".encode())
+        sha.update(array.data)
+    return f"{metric} {sha.hexdigest()}"
 
+def _read_manifest(filename, N):
+    """
+    Fingerprint of the manifest and boolean array of the rows whose tiles
+    are listed in it, (None, None) if not even the fingerprint was written.
+    An incomplete last line of an interrupted write is removed from the file.
+    """
+    with open(filename) as f:
+        lines = [line for line in f if line.endswith('\n')]
+    if not lines:
+        return None, None
+    with open(filename, 'w') as f:
+        f.writelines(lines)
+
+    done = np.zeros(N, dtype=bool)
+    for line in lines[1:]:
+        start, stop = map(int, line.split())
+        done[start:stop] = True
+    return lines[0].rstrip('\n'), done
+
+def _checkpoint(out, shape, dtype, N, fingerprint):
+    """
+    Matrix file `out` as np.memmap and the rows that are already computed.
+    A file with a manifest is resumed, unless it belongs to a computation
+    with another fingerprint, shape or dtype.
+    """
+    manifest = f"{out}{MANIFEST_SUFFIX}"
+    if os.path.exists(manifest):
+        previous, done = _read_manifest(manifest, N)
+        if previous is not None:
+            D = open_matrix(out, shape, dtype)
+            if previous != fingerprint or D is None:
+                raise Exception(f"{out} holds a matrix of another input or "
+                                 "metric! Remove it and its manifest to "
+                                 "start over.")
+            return D, done
+    D = create_matrix(out, shape, dtype)
+    with open(manifest, 'w') as f:
+        f.write(f"{fingerprint}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    return D, np.zeros(N, dtype=bool)
+
+def _buffer_filename():
+    directory = SHM_PATH if os.path.isdir(SHM_PATH) else TMP_PATH
+    return f"{directory}/graco{os.getpid()}_{_get_timestamp()}"
+
+def _run_tool(tool, M, dtype, out=None):
+    """
+    Runs a C++ tool on memory-mapped copies of M and of its (N,N) result.
+    The result is returned in memory, or with a filename `out` it stays in
+    that file and is returned as np.memmap.
+    """
+    filename   = _buffer_filename()
+    matrix_in  = f"{filename}.in"
+    matrix_out = f"{filename}.out" if out is None else out
+    try:
+        M_in = create_matrix(matrix_in, M.shape, dtype)
+        M_in[:] = M
+        M_in.flush()
+        del M_in
+        D = create_matrix(matrix_out, (len(M), len(M)))
+        try:
+            run_cmd([f"{CPP_PATH}/{tool}", matrix_in, matrix_out])
+        except OSError as error:
+            raise Exception(f"C++ tool {tool} cannot be executed, build it "
+                            f"with `make -C {CPP_PATH}`!") from error
+        if out is None:
+            D = np.array(D)
+    finally:
         os.remove(matrix_in)
-        os.remove(matrix_out)
+        if out is None and os.path.exists(matrix_out):
+            os.remove(matrix_out)
+    return D
+
 
-        return D_arr
+def _tile_rows(N, C, tile_size=None):
+    """
+    Number of rows of a tile of N nodes with C features each, at most
+    TILE_ELEMENTS entries per tile if no tile_size is given.
+    """
+    if tile_size is not None:
+        return max(1, tile_size)
+    return max(1, TILE_ELEMENTS // max(N*C, 1))
+
+def _pairwise(kernel, X, n_jobs=1, condensed=False, dtype=np.float64,
+                            out=None, tile_size=None, fingerprint=None):
+    """
+    Symmetric (N,N) matrix of kernel(X[rows], X[start:]) computed in tiles
+    of rows against all later rows by a pool of n_jobs threads (-1 for all
+    cores). numpy releases the GIL in the kernels, so the tiles run in
+    parallel. Every thread writes its tile and the mirrored one, so the
+    result is exactly symmetric. With condensed=True, only the upper
+    triangle is kept (see graco.condensed). A tile has tile_size rows,
+    by default as many as fit into TILE_ELEMENTS entries.
+
+    With a filename `out`, the matrix is a np.memmap of a binary matrix file
+    and only a tile is held in memory at a time. Finished tiles are recorded
+    in the manifest once they are flushed, and skipped when the computation
+    with the same fingerprint (see _fingerprint) is repeated.
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    N = len(X)
+    rows = _tile_rows(N, X.shape[1], tile_size)
+    shape = (N*(N-1)//2,) if condensed else (N,N)
+    if out is None:
+        D, done = np.zeros(shape, dtype=dtype), np.zeros(N, dtype=bool)
     else:
-        raise Exception(f"Datatype not integer. {M.dtype}")
+        D, done = _checkpoint(out, shape, dtype, N, fingerprint)
+    lock = threading.Lock()
+    pending, written = [], 0
+
+    def checkpoint(force=False):
+        nonlocal written
+        if not pending or (written < FLUSH_BYTES and not force):
+            return
+        D.flush()
+        with open(f"{out}{MANIFEST_SUFFIX}", 'a') as f:
+            f.writelines(f"{start} {stop}\n" for start, stop in pending)
+            f.flush()
+            os.fsync(f.fileno())
+        pending.clear()
+        written = 0
 
+    def tile(start):
+        nonlocal written
+        stop = min(start+rows, N)
+        D_tile = kernel(X[start:stop], X[start:])
+        if condensed:
+            offsets = condensed_rows(N, start, stop)
+            for r, offset in enumerate(offsets):
+                D[offset:offset+N-start-r-1] = D_tile[r, r+1:]
+        else:
+            lower = np.tril_indices(stop-start, -1)
+            D_tile[lower] = D_tile[lower[::-1]]
+            np.fill_diagonal(D_tile, 0)
+            D[start:stop, start:] = D_tile
+            D[stop:, start:stop]  = D_tile[:, stop-start:].T
+        if out is not None:
+            with lock:
+                pending.append((start, stop))
+                written += D.itemsize * D_tile.size * (1 if condensed else 2)
+                checkpoint()
 
-def hellinger(M):
+    starts = [start for start in range(0, N, rows)
+                        if not done[start:start+rows].all()]
+    try:
+        with ThreadPoolExecutor(n_jobs) as pool:
+            list(pool.map(tile, starts))
+    finally:
+        if out is not None:
+            checkpoint(force=True)
+    return D
+
+def _as(D, M, condensed, dtype):
+    """
+    Returns the square or condensed matrix D of the rows of M as requested
+    by the keywords of the functions below; condensed matrices carry the
+    index of M (or the row numbers) as labels.
+    """
+    if D.ndim == 2 and condensed:
+        D = squareform(D, checks=False)
+    D = D.astype(dtype, copy=False)
+    if not condensed:
+        return D
+    labels = M.index if type(M) == pd.DataFrame else range(len(M))
+    return CondensedMatrix(D, labels)
+
+def _normalize(M):
     if type(M) == pd.DataFrame:
         M = M.values
-    M = (M.T / M.sum(axis=1)).T  #transposing back and forth for broadcasting
+    return (M.T / M.sum(axis=1)).T  #transposing back and forth for broadcasting
 
-    timestamp = _get_timestamp()
-    matrix_in  = f"{TMP_PATH}/hell{timestamp}.in"
-    matrix_out = f"{TMP_PATH}/hell{timestamp}.out"
-    write_matrix(matrix_in, M, fmt='%.7f')
-    cmd = [f"{CPP_PATH}/hellinger", matrix_in, matrix_out]
-    run_cmd(cmd)
 
-    D_arr = np.loadtxt(matrix_out)
+def _GDV_similarity_kernel(weights):
+    def kernel(U, V):
+        log_U, log_V = np.log1p(U), np.log1p(V)
+        terms = np.abs(log_U[:,None] - log_V[None]) / \
+                        np.log(np.maximum(U[:,None], V[None]) + 2)
+        return terms @ weights / weights.sum()
+    return kernel
 
-    os.remove(matrix_in)
-    os.remove(matrix_out)
+def _hellinger_kernel(U, V):
+    square = (U*U).sum(axis=1)[:,None] + (V*V).sum(axis=1)[None] \
+                                       - 2 * U @ V.T
+    return np.sqrt(np.maximum(square, 0)) / np.sqrt(2)
 
-    return D_arr
+def _js_divergence_kernel(U, V):
+    M = (U[:,None] + V[None]) / 2
+    entropy = (xlogy(U, U).sum(axis=1)[:,None] +
+               xlogy(V, V).sum(axis=1)[None]) / 2
+    return np.maximum(entropy - xlogy(M, M).sum(axis=2), 0) / np.log(2)
 
 
-def js_divergence(M):
-    if type(M) == pd.DataFrame:
-        M = M.values
-    M = (M.T / M.sum(axis=1)).T  #transposing back and forth for broadcasting
+def _metric_kernel(metric, X):
+    """
+    Prepared rows of X and tile kernel of the distance `metric`. The
+    parameters of 'seuclidean' and 'mahalanobis' are estimated from the
+    rows without NaNs, as pdist does.
+    """
+    valid = X[~np.isnan(X).any(axis=1)]
+    if   metric == 'GDV_similarity':
+        orbit_dependencies = graco.distances.ORBIT_DEPENDENCIES[:X.shape[1]]
+        weights = 1 - np.log(orbit_dependencies) / \
+                      np.log(len(orbit_dependencies))
+        return X, _GDV_similarity_kernel(weights)
+    elif metric == 'hellinger':
+        # clips negative rounding errors, e.g. of 1-a-b in convex combinations
+        return np.sqrt(np.maximum(_normalize(X), 0)), _hellinger_kernel
+    elif metric == 'js_divergence':
+        return _normalize(X), _js_divergence_kernel
+    elif metric == 'seuclidean':
+        V = valid.var(axis=0, ddof=1)
+        return X, partial(cdist, metric=metric, V=V)
+    elif metric == 'mahalanobis':
+        VI = np.linalg.inv(np.cov(valid.T)).T
+        return X, partial(cdist, metric=metric, VI=VI)
+    return X, partial(cdist, metric=metric)
+
+def pairwise(M, metric, n_jobs=1, out=None, condensed=False,
+             dtype=np.float64, tile_size=None):
+    """
+    Distance matrix of the rows of M for any metric of graco.distance,
+    computed in tiles of tile_size rows by _pairwise. With a filename `out`,
+    the matrix is computed out of core into that file and can be resumed.
+    """
+    X, kernel = _metric_kernel(metric, np.asarray(M, dtype=float))
+    fingerprint = None if out is None else _fingerprint(metric, X)
+    D = _pairwise(kernel, X, n_jobs, condensed, dtype, out, tile_size,
+                                                           fingerprint)
+    return _as(D, M, condensed, dtype)
+
+def GDV_similarity(M, backend='numpy', n_jobs=1, out=None, condensed=False,
+                   dtype=np.float64, tile_size=None):
+    if backend == 'cpp':
+        return _as(_cpp_GDV_similarity(M, out), M, condensed, dtype)
+    elif backend != 'numpy':
+        raise Exception(f"Backend {backend} not known!")
+    return pairwise(M, 'GDV_similarity', n_jobs, out, condensed, dtype, tile_size)
+
+def hellinger(M, backend='numpy', n_jobs=1, out=None, condensed=False,
+              dtype=np.float64, tile_size=None):
+    if backend == 'cpp':
+        return _as(_cpp_hellinger(M, out), M, condensed, dtype)
+    elif backend != 'numpy':
+        raise Exception(f"Backend {backend} not known!")
+    return pairwise(M, 'hellinger', n_jobs, out, condensed, dtype, tile_size)
+
+def js_divergence(M, backend='numpy', n_jobs=1, out=None, condensed=False,
+                  dtype=np.float64, tile_size=None):
+    if backend == 'cpp':
+        return _as(_cpp_js_divergence(M, out), M, condensed, dtype)
+    elif backend != 'numpy':
+        raise Exception(f"Backend {backend} not known!")
+    return pairwise(M, 'js_divergence', n_jobs, out, condensed, dtype, tile_size)
+
+def _equation_kernel(metric, X):
+    """
+    Prepared coefficients, tile kernel and normalizer of the distance
+    `metric` on the coefficients X of one equation, NaN rows included.
+    """
+    X, kernel = _metric_kernel(metric, X)
+    if metric == 'seuclidean':
+        s1, s2 = sorted(kernel.keywords['V'])[:2]
+        return X, kernel, np.sqrt(1/s1 +1/s2)
+    return X, kernel, graco.core.normalizer(metric, X.shape[1])
 
-    timestamp = _get_timestamp()
-    matrix_in  = f"{TMP_PATH}/js{timestamp}.in"
-    matrix_out = f"{TMP_PATH}/js{timestamp}.out"
-    write_matrix(matrix_in, M, fmt='%.7f')
-    cmd = [f"{CPP_PATH}/js_divergence", matrix_in, matrix_out]
-    run_cmd(cmd)
+def _GCV_kernel(offsets, kernels):
+    """
+    Mean of the normalized distances of all equations, given by the column
+    offsets and (kernel, d_max) of every equation, over the equations in
+    which both nodes have coefficients.
+    """
+    def kernel(U, V):
+        S = np.zeros((len(U), len(V)))
+        C = np.zeros((len(U), len(V)), dtype=np.uint16)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for start, stop, (eq_kernel, d_max) in zip(offsets[:-1],
+                                                       offsets[1:], kernels):
+                u_valid = ~np.isnan(U[:,start])
+                v_valid = ~np.isnan(V[:,start])
+                D = eq_kernel(U[:,start:stop], V[:,start:stop]) / d_max
+                if u_valid.all() and v_valid.all():
+                    S += D
+                    C += 1
+                else:
+                    valid = u_valid[:,None] & v_valid[None]
+                    np.add(S, D, out=S, where=valid)
+                    np.add(C, 1, out=C, where=valid)
+            return S / C
+    return kernel
 
-    D_arr = np.loadtxt(matrix_out)
+def _GCV_metric_kernel(metric, GCV):
+    """
+    Prepared coefficients and tile kernel of the equation-wise distance of a
+    GCVArray, and the (nodes, equations) array of valid coefficients.
+    """
+    isnan = np.isnan(GCV.values)
+    starts = GCV.offsets[:-1]
+    valid = ~np.logical_or.reduceat(isnan, starts, axis=1)
+    assert (valid == ~np.logical_and.reduceat(isnan, starts, axis=1)).all()
+
+    prepared, kernels = [], []
+    for n, (eq, coeffs) in enumerate(GCV.iter_equations()):
+        if valid[:,n].any():
+            coeffs, eq_kernel, d_max = _equation_kernel(metric, coeffs)
+        else:
+            eq_kernel, d_max = (lambda U, V: np.zeros((len(U), len(V)))), 1
+        prepared.append(coeffs)
+        kernels.append((eq_kernel, d_max))
+    return np.hstack(prepared), _GCV_kernel(GCV.offsets, kernels), valid
+
+def GCV_distance(GCV, metric, n_jobs=1, out=None, condensed=False,
+                 dtype=np.float64, tile_size=None):
+    """
+    Equation-wise distance matrix of a GCVArray as in
+    graco.GCV_distance_matrix. All equations are computed together on tiles
+    of rows (see _pairwise), pairs of nodes are averaged over the equations
+    in which both have coefficients and are NaN if there are none. With a
+    filename `out`, the matrix is computed out of core into that file.
+    """
+    X, kernel, valid = _GCV_metric_kernel(metric, GCV)
+    fingerprint = None if out is None else _fingerprint(metric, X,
+                                                                GCV.offsets)
+    D = _pairwise(kernel, X, n_jobs, condensed, dtype, out, tile_size,
+                                                           fingerprint)
+    if condensed:
+        return CondensedMatrix(D, GCV.index)
+    D[np.diag_indices(len(D))] = np.where(valid.any(axis=1), 0, np.nan)
+    if out is not None:
+        D.flush()
+    return pd.DataFrame(D, index=GCV.index, columns=GCV.index, copy=False)
+
+
+def _cpp_GDV_similarity(M, out=None):
+    if type(M) == pd.DataFrame:
+        M = M.values
+    if M.dtype == int:
+        return _run_tool('int_GDV-similarity', M, np.int64, out)
+    else:
+        raise Exception(f"Datatype not integer. {M.dtype}")
 
-    os.remove(matrix_in)
-    os.remove(matrix_out)
+def _cpp_hellinger(M, out=None):
+    return _run_tool('hellinger', _normalize(M), np.float64, out)
 
-    return D_arr
+def _cpp_js_divergence(M, out=None):
+    return _run_tool('js_divergence', _normalize(M), np.float64, out)
@@ -26,11 +26,17 @@ def js_divergence(p,q):
     return np.sum(p*log1 +q*log2)/(2*np.log(2))
 
 
+# number of orbits that affect every orbit (Milenkovic and Przulj, 2008)
+ORBIT_DEPENDENCIES = np.array((1,2,2,2,3,4,3,3,4,3,4,4,4,4,3,
+                               4,6,5,4,5,6,6,4,4,4,5,7,4,6,6,7,4,6,6,6,
+                               5,6,7,7,5,7,6,7,6,5,5,6,8,7,6,6,8,6,9,5,
+                               6,4,6,6,7,8,6,6,8,7,6,7,7,8,5,6,6,4))
+
 def GDV_similarity(u,v):
     log_u = np.log(np.array(u+1))
     log_v = np.log(np.array(v+1))
 
-    orbit_dependencies = np.array((1,2,2,2,3,4,3,3,4,3,4,4,4,4,3))
+    orbit_dependencies = ORBIT_DEPENDENCIES[:len(u)]
     weights = 1 - np.log(orbit_dependencies) / np.log(len(orbit_dependencies))
 
     res = np.sum(weights*np.abs(log_u-log_v) /
@@ -0,0 +1,191 @@
+"""
+Graphlet degree vectors that are kept up to date under edge insertions and
+deletions.
+
+An edge (a,b) only changes the induced graphlets on node sets that contain
+both a and b. Every update enumerates these sets (at most 4 nodes, connected
+once the edge is present), classifies them with and without the edge and
+moves the orbit counts of their nodes accordingly.
+"""
+
+from graco import counting
+
+import pandas as pd
+import numpy as np
+import graco
+
+ORBIT_NAMES = list(map(str,range(15)))
+
+
+def _orbit_table(n):
+    """
+    Orbit of every node of every labelled graph on n=3 or n=4 nodes, or -1 if
+    the graph is disconnected. Edges are encoded as bits in the order of
+    itertools.combinations(range(n), 2).
+    """
+    pairs = [(i,j) for i in range(n) for j in range(i+1,n)]
+    table = np.full((2**len(pairs), n), -1, dtype=np.int64)
+    for pattern in range(2**len(pairs)):
+        deg = np.zeros(n, dtype=np.int64)
+        for bit, (i,j) in enumerate(pairs):
+            if pattern >> bit & 1:
+                deg[i] += 1
+                deg[j] += 1
+        m = deg.sum() // 2
+        if m < n-1 or (deg == 0).any():
+            continue
+        if n == 3:
+            table[pattern] = np.where(m == 3, 3, deg)
+        elif m == 3:
+            if deg.max() == 3:
+                table[pattern] = np.where(deg == 3, 7, 6)
+            else:
+                table[pattern] = np.where(deg == 1, 4, 5)
+        elif m == 4:
+            if (deg == 2).all():
+                table[pattern] = 8
+            else:
+                table[pattern] = 8 + deg
+        elif m == 5:
+            table[pattern] = 10 + deg
+        else:
+            table[pattern] = 14
+    return table
+
+# node order (a,b,c) and (a,b,c,e); the edge (a,b) is always bit 0
+ORBITS3 = _orbit_table(3)
+ORBITS4 = _orbit_table(4)
+
+
+class DynamicGDV:
+    """
+    GDV of a graph that supports add_edge and remove_edge. Every update only
+    touches the nodes within distance two of the edge, and coefficients()
+    only recomputes the rows that changed since its last call.
+    Self-loops are ignored, just like in Calculate.orbits.
+    """
+    def __init__(self, G, GDV=None):
+        self.nodes  = list(G)
+        self._index = {name:n for n,name in enumerate(self.nodes)}
+        self._adj   = [set() for _ in self.nodes]
+        for u,v in G.edges():
+            if u != v:
+                self._adj[self._index[u]].add(self._index[v])
+                self._adj[self._index[v]].add(self._index[u])
+
+        if GDV is None:
+            edges = [(self._index[u], self._index[v]) for u,v in G.edges()]
+            A = counting.edges_to_csr(edges, len(self.nodes))
+            self._GDV = counting.orbit_counts(A)
+        else:
+            self._GDV = GDV.loc[self.nodes, ORBIT_NAMES].values.astype(np.int64)
+
+        self._GCV = None
+        self._changed = set(range(len(self.nodes)))
+
+    @property
+    def GDV(self):
+        df = pd.DataFrame(self._GDV, index   = self.nodes,
+                                     columns = ORBIT_NAMES)
+        df.columns.name = 'Orbit'
+        return df
+
+    def has_edge(self, u, v):
+        return u in self._index and v in self._index and \
+                            self._index[v] in self._adj[self._index[u]]
+
+    def add_edge(self, u, v):
+        if u == v or self.has_edge(u, v):
+            return
+        for node in (u,v):
+            if node not in self._index:
+                self._add_node(node)
+        a, b = self._index[u], self._index[v]
+        self._update(a, b, sign=1)
+        self._adj[a].add(b)
+        self._adj[b].add(a)
+
+    def remove_edge(self, u, v):
+        if not self.has_edge(u, v):
+            raise KeyError(f"The edge {u}-{v} is not in the graph.")
+        a, b = self._index[u], self._index[v]
+        self._adj[a].remove(b)
+        self._adj[b].remove(a)
+        self._update(a, b, sign=-1)
+
+    def _add_node(self, node):
+        self._index[node] = len(self.nodes)
+        self.nodes.append(node)
+        self._adj.append(set())
+        self._GDV = np.vstack([self._GDV, np.zeros((1,15), dtype=np.int64)])
+        self._changed.add(self._index[node])
+
+    def _shift(self, nodes, patterns, table, sign):
+        """
+        Moves the orbit counts of the node sets `nodes` (one per row) from
+        their graphlet without the edge (a,b) to the one with it.
+        """
+        for edge, step in ((0, -sign), (1, sign)):
+            orbits = table[patterns | edge]
+            valid  = orbits >= 0
+            np.add.at(self._GDV, (nodes[valid], orbits[valid]), step)
+
+    def _update(self, a, b, sign):
+        """
+        Updates the GDV for adding (sign=1) or removing (sign=-1) the edge
+        (a,b).
+        """
+        adj = self._adj
+        M   = np.array(sorted((adj[a] | adj[b]) - {a,b}), dtype=np.int64)
+        ac  = np.array([c in adj[a] for c in M], dtype=np.int64)
+        bc  = np.array([c in adj[b] for c in M], dtype=np.int64)
+
+        self._GDV[[a,b],0] += sign
+
+        # node sets {a,b,c}, bits (ab, ac, bc)
+        nodes = np.column_stack([np.full(len(M), a), np.full(len(M), b), M])
+        self._shift(nodes, ac << 1 | bc << 2, ORBITS3, sign)
+
+        # node sets {a,b,c,e} with c and e both adjacent to a or b,
+        # bits (ab, ac, ae, bc, be, ce)
+        degrees = [len(adj[c]) for c in M]
+        k = np.repeat(np.arange(len(M)), degrees)
+        e = np.fromiter((x for c in M for x in adj[c]), dtype  = np.int64,
+                                                        count  = sum(degrees))
+        pos = np.minimum(np.searchsorted(M, e), max(len(M)-1, 0))
+        in_M = (M[pos] == e) if len(M) else np.zeros(0, bool)
+        inner = np.zeros((len(M),len(M)), dtype=np.int64)
+        inner[k[in_M], pos[in_M]] = 1
+        outer = ~in_M & (e != a) & (e != b)
+        k, e = k[outer], e[outer]
+
+        i, j = np.triu_indices(len(M), 1)
+        nodes = np.column_stack([np.full(len(i), a), np.full(len(i), b),
+                                 M[i], M[j]])
+        patterns = ac[i] << 1 | ac[j] << 2 | bc[i] << 3 | bc[j] << 4 \
+                                           | inner[i,j] << 5
+        self._shift(nodes, patterns, ORBITS4, sign)
+
+        # node sets {a,b,c,e} with e only adjacent to c
+        nodes = np.column_stack([np.full(len(k), a), np.full(len(k), b),
+                                 M[k], e])
+        self._shift(nodes, ac[k] << 1 | bc[k] << 3 | 1 << 5, ORBITS4, sign)
+
+        self._changed.update((a,b))
+        self._changed.update(M.tolist())
+        self._changed.update(e.tolist())
+
+    def coefficients(self):
+        """
+        Returns the GCV, recomputing only the rows whose GDV changed since the
+        last call.
+        """
+        rows = sorted(self._changed)
+        if self._GCV is None or len(self._GCV) < len(self.nodes):
+            self._GCV = graco.functions.Calculate.coefficients(self.GDV)
+        elif rows:
+            GDV = self.GDV.iloc[rows]
+            self._GCV.iloc[rows] = graco.functions.Calculate.coefficients(
+                                                                    GDV).values
+        self._changed = set()
+        return self._GCV.copy()
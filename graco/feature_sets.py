@@ -0,0 +1,70 @@
+"""
+Named feature sets of Calculate.features.
+
+Every GCV feature set is a selection of the equations in graco.graphlets,
+given by whole groups, single equations and equations to leave out. The
+orbits that a set needs follow from its equations, so that e.g. 'GCV-3' only
+requires degrees and triangles.
+
+    graco.features(G, 'GCV-DG-sym')
+    graco.feature_sets.register('GCV-DA-0', equations=[('D','0'),('A','0')])
+"""
+
+from graco import graphlets
+
+SYMMETRIC_G = [('G','0-0'), ('G','1-1'), ('G','3-3')]
+THREE_NODE  = [('A','0'), ('D','0')]
+
+# name: (groups, equations, dropped equations)
+FEATURES = {
+    # single equation sets
+    'GCV-D'           : (['D'], [], []),
+    'GCV-A'           : (['A'], [], []),
+    'GCV-G'           : (['G'], [], []),
+    'GCV-G-sym'       : ([], SYMMETRIC_G, []),
+    'GCV-O'           : (['O'], [], []),
+    'GCV-3'           : ([], THREE_NODE, []),
+
+    # combined equation sets
+    'GCV-DA'          : (['D','A'], [], []),
+    'GCV-DG'          : (['D','G'], [], []),
+    'GCV-DO'          : (['D','O'], [], []),
+    'GCV-all'         : (['D','A','G','O'], [], [('G','0-0')]),
+    'GCV-DG-2'        : (['D','G'], [], [('G','2-1')]),
+    'GCV-DG-3'        : (['D','G'], [], [('G','3-3')]),
+    'GCV-DG-sym'      : (['D'], SYMMETRIC_G, []),
+    'GCV-DAG'         : (['D','A','G'], [], [('G','0-0')]),
+    'GCV-DAG-reduced' : (['D','A','G'], [], [('G','0-0'), ('G','1-2'),
+                                             ('G','2-1'), ('G','3-3')]),
+    'GCV-O+'          : (['O'], THREE_NODE, []),
+}
+
+
+def register(name, groups=(), equations=(), drop=()):
+    FEATURES[name] = (list(groups), list(equations), list(drop))
+
+def equations(name, graphlet_nodes=4):
+    """
+    Equations of the feature set `name` in the format of
+    graphlets.EQUATIONS4. graphlet_nodes=5 selects from the equations of the
+    5-node graphlets as well.
+    """
+    if name not in FEATURES:
+        raise Exception(f"Feature {name} not known!")
+    groups, selected, drop = FEATURES[name]
+    selected, drop = set(map(tuple, selected)), set(map(tuple, drop))
+
+    candidates = graphlets.EQUATIONS4
+    if graphlet_nodes == 5:
+        candidates = candidates + graphlets.EQUATIONS5
+    return [(group, equation, terms) for group, equation, terms in candidates
+                if (group in groups or (group, equation) in selected)
+                and (group, equation) not in drop]
+
+def orbits(name, graphlet_nodes=4):
+    """
+    Sorted orbits that the equations of `name` depend on.
+    """
+    return sorted({orbit for group, equation, terms
+                                in equations(name, graphlet_nodes)
+                         for orbit in terms})
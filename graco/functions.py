@@ -4,14 +4,20 @@
 Created on Mon Sep 16 17:22:20 2019
 @author: clusterduck
 
-DON'T PARALLELIZE ORCA COMPUTATIONS!!!
+DON'T PARALLELIZE Write.orbits WITH THE DEFAULT PATHS!!!
+Calculate.orbits pipes the edges through ORCA and touches no files.
 """
 
+from graco.dynamic import DynamicGDV
+from graco.gcv import GCVArray
+from graco import counting, cache, feature_sets, graphlets, sampling
+
+import multiprocessing
+import scipy.sparse
 import networkx as nx
 import pandas as pd
 import numpy as np
 import subprocess
-import random
 import time
 import os
 
@@ -19,12 +25,16 @@ CURRENT_PATH = os.path.dirname(__file__)
 TMP_PATH  = f"{CURRENT_PATH}/tmp"
 ORCA_PATH = f"{CURRENT_PATH}/orca/orca"
 
+NUMBER_OF_ORBITS = {4:15, 5:73}
+
+# Average degree up to which the in-process counting is faster than ORCA;
+# on denser graphs ORCA is the default backend.
+GRACO_MAX_DEGREE = 12
+
 def get_edgelist_path():
     return f"{CURRENT_PATH}/tmp/edgelist.tmp"
 def get_orbits_path():
     return f"{CURRENT_PATH}/tmp/orbits.tmp"
-def _get_timestamp():
-    return time.time()*random.random()
 
 def run_cmd(cmd):
     completed_process = subprocess.run(cmd,
@@ -34,6 +44,156 @@ def run_cmd(cmd):
         raise subprocess.CalledProcessError(cmd = cmd,
                     returncode = completed_process.returncode)
 
+def to_adjacency(G, labels=None):
+    """
+    Returns the binary symmetric CSR adjacency matrix without self-loops and
+    the node labels of G, which is either a networkx graph, a scipy sparse
+    adjacency matrix or an (M,2) integer array of edges. The rows of the
+    matrix and the edge array refer to positions in `labels` (default:
+    range(N)). G itself is never modified.
+    """
+    if isinstance(G, nx.Graph):
+        labels = list(G)
+        index = {node:n for n,node in enumerate(labels)}
+        edges = [(index[u], index[v]) for u,v in G.edges()]
+        return counting.edges_to_csr(edges, len(labels)), labels
+    elif scipy.sparse.issparse(G):
+        N = G.shape[0]
+        A = counting.to_csr(G)
+    elif isinstance(G, np.ndarray) and G.ndim == 2 and G.shape[1] == 2:
+        N = len(labels) if labels is not None else int(G.max(initial=-1)) + 1
+        A = counting.edges_to_csr(G, N)
+    else:
+        raise TypeError('Please provide an appropriate type.')
+
+    if labels is None:
+        labels = range(N)
+    elif len(labels) != N:
+        raise Exception(f"{len(labels)} node labels for {N} nodes!")
+    return A, list(labels)
+
+def _ball_adjacency(G, nodes, radius=2):
+    """
+    Adjacency matrix and labels of the subgraph of the networkx graph G
+    induced by the nodes within `radius` of `nodes`, and the degrees of its
+    nodes in G without self-loops.
+    """
+    ball, frontier = set(nodes), set(nodes)
+    for _ in range(radius):
+        frontier = {v for u in frontier for v in G[u]} - ball
+        ball |= frontier
+    A, labels = to_adjacency(G.subgraph(ball))
+    degrees = [len(G[u]) - (u in G[u]) for u in labels]
+    return A, labels, degrees
+
+def _edge_array(G, labels=None):
+    """
+    Returns the edges of G as an (M,2) array of node positions.
+    """
+    A, _ = to_adjacency(G, labels)
+    U = scipy.sparse.triu(A, k=1, format='coo')
+    return np.column_stack([U.row, U.col]).astype(np.int64)
+
+def _read_orbits(stream, N, n_orbits, block_size=2**20):
+    """
+    Parses N lines of n_orbits integers from a binary stream into an (N,
+    n_orbits) int64 array without holding the whole text in memory.
+    """
+    GDV_arr = np.zeros((N, n_orbits), dtype=np.int64)
+    row = 0
+    while row < N:
+        lines = stream.readlines(block_size)
+        if not lines:
+            break
+        block = np.fromstring(b''.join(lines), dtype=np.int64, sep=' ')
+        block = block.reshape(-1, n_orbits)
+        GDV_arr[row:row+len(block)] = block
+        row += len(block)
+    stream.read()
+    return GDV_arr
+
+def run_orca(edges, N, graphlet_nodes=4):
+    """
+    Runs ORCA on an (M,2) array of node indices in range(N) without temporary
+    files: the edge list is piped into the process and the orbits are read
+    back through a second pipe, block by block, into an int64 array.
+    """
+    read_fd, write_fd = os.pipe()
+    cmd = [ORCA_PATH, str(graphlet_nodes), '/dev/stdin', f"/dev/fd/{write_fd}"]
+    try:
+        with subprocess.Popen(cmd, stdin    = subprocess.PIPE,
+                                   stdout   = subprocess.DEVNULL,
+                                   stderr   = subprocess.PIPE,
+                                   pass_fds = [write_fd]) as process:
+            # only ORCA may hold the write end, or reading never ends
+            os.close(write_fd)
+            write_fd = None
+            with os.fdopen(read_fd, 'rb') as orbits_out:
+                read_fd = None
+                try:
+                    process.stdin.write(f"{N} {len(edges)}\n".encode())
+                    np.savetxt(process.stdin, edges, fmt='%d')
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+                GDV_arr = _read_orbits(orbits_out, N,
+                                       NUMBER_OF_ORBITS[graphlet_nodes])
+            stderr = process.stderr.read()
+    finally:
+        for fd in [read_fd, write_fd]:
+            if fd is not None:
+                os.close(fd)
+
+    if process.returncode or stderr:
+        raise subprocess.CalledProcessError(cmd        = cmd,
+                                            returncode = process.returncode,
+                                            stderr     = stderr)
+
+    return GDV_arr
+
+def _size(G):
+    if isinstance(G, nx.Graph):
+        return G.number_of_edges()
+    elif scipy.sparse.issparse(G):
+        return G.nnz
+    return len(G)
+
+def _timed(method, key, G, kwargs):
+    start = time.time()
+    result = getattr(Calculate, method)(G, **kwargs)
+    return key, result, time.time()-start
+
+def _imap(tasks, n_jobs):
+    if n_jobs == 1:
+        for task in tasks:
+            yield _timed(*task)
+    else:
+        with multiprocessing.Pool(n_jobs) as p:
+            yield from p.imap_unordered(_timed_task, tasks)
+
+def _timed_task(task):
+    return _timed(*task)
+
+def _many(method, graphs, n_jobs, stream, kwargs):
+    """
+    Runs Calculate.<method> on every graph of a list or dict in a pool of
+    n_jobs processes (-1 for all cores), largest graphs first.
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    keys  = list(graphs) if isinstance(graphs, dict) else range(len(graphs))
+    tasks = sorted(((method, key, graphs[key], kwargs) for key in keys),
+                   key = lambda task: _size(task[2]), reverse=True)
+    results = _imap(tasks, n_jobs)
+    if stream:
+        return results
+
+    values, seconds = {}, {}
+    for key, value, duration in results:
+        values[key], seconds[key] = value, duration
+    return ({key:values[key]  for key in keys},
+            {key:seconds[key] for key in keys})
+
 
 class Write:
     @staticmethod
@@ -42,12 +202,10 @@ class Write:
         if file_in is None:
             file_in = get_edgelist_path()
 
-        nx.write_edgelist(G, file_in, data=False)
         N, M = G.number_of_nodes(), G.number_of_edges()
-        with open(file_in, 'r+') as f:
-            content = f.read()
-            f.seek(0)
-            f.write(f"{N} {M}\n" + content)
+        with open(file_in, 'wb') as f:
+            f.write(f"{N} {M}\n".encode())
+            nx.write_edgelist(G, f, data=False)
 
     @staticmethod
     def orbits(G, file_in=None, file_out=None, graphlet_nodes=4):
@@ -64,35 +222,91 @@ class Write:
         run_cmd(orca_cmd)
 
 
+def _GCV_as(GCV, dtype):
+    """
+    Converts a GCV DataFrame or GCVArray to dtype (pd.DataFrame, GCVArray or
+    np.ndarray, whose columns are sorted like those of the DataFrame).
+    """
+    if type(GCV) == pd.DataFrame:
+        if dtype == pd.DataFrame:
+            return GCV
+        GCV = GCVArray.from_frame(GCV)
+    if   dtype == pd.DataFrame:
+        return GCV.to_frame()
+    elif dtype == GCVArray:
+        return GCV
+    elif dtype == np.ndarray:
+        return GCV.values
+    else:
+        raise TypeError('Please provide an appropriate type.')
+
+
 class Calculate:
     @staticmethod
-    def orbits(G, dtype=pd.DataFrame):
+    def orbits(G, dtype=pd.DataFrame, backend=None, n_jobs=1,
+                  graphlet_nodes=4, labels=None, nodes=None):
         """
-        This method will remove self loops!
+        G is a networkx graph, a scipy sparse adjacency matrix or an (M,2)
+        integer edge array, with optional node labels `labels`. Self-loops
+        are ignored and G is not modified.
+        Orbits of up to 4 nodes are counted in-process (backend='graco') or
+        by the ORCA binary (backend='orca'). By default, graphs with an
+        average degree above GRACO_MAX_DEGREE go to ORCA, unless n_jobs or
+        nodes ask for the in-process backend. n_jobs > 1 (or -1 for all
+        cores) counts shards of the nodes in parallel processes.
+        graphlet_nodes=5 counts the 73 orbits of up to 5 nodes with ORCA.
+        With a list of `nodes`, only their rows are returned. The in-process
+        backend then only explores the neighbourhoods of these nodes, and of
+        a networkx graph only the ball of radius 2 around them is converted.
+        Such calls bypass graco.cache, whose key needs the whole graph.
         """
-        
-        G.remove_edges_from(nx.selfloop_edges(G))
-
-        label_mapping   = {name:n for n,name in enumerate(G)}
-        reverse_mapping = {value:key for key,value in label_mapping.items()}
-
-        G = nx.relabel_nodes(G, label_mapping)
+        if graphlet_nodes not in NUMBER_OF_ORBITS:
+            raise Exception(f"Graphlet size {graphlet_nodes} not known!")
 
-        timestamp = _get_timestamp()
-        file_in = f"{CURRENT_PATH}/tmp/{timestamp}.in"
-        file_out = f"{CURRENT_PATH}/tmp/{timestamp}.out"
-
-        Write.orbits(G=G, file_in=file_in, file_out=file_out)
-        GDV_arr = D = np.loadtxt(file_out, dtype=int)
-
-        os.remove(file_in)
-        os.remove(file_out)
+        degrees = None
+        if nodes is not None and isinstance(G, nx.Graph) and \
+                        backend in [None, 'graco'] and graphlet_nodes == 4:
+            A, labels, degrees = _ball_adjacency(G, nodes)
+        else:
+            A, labels = to_adjacency(G, labels)
+
+        positions = None
+        if nodes is not None:
+            index = {label:n for n,label in enumerate(labels)}
+            positions = np.array([index[node] for node in nodes],
+                                 dtype=np.int64)
+
+        if backend is None:
+            sparse = A.nnz <= GRACO_MAX_DEGREE*A.shape[0]
+            backend = 'graco' if graphlet_nodes == 4 and (sparse or n_jobs != 1
+                                        or nodes is not None) else 'orca'
+
+        GDV_arr, key = None, None
+        if nodes is None:
+            GDV_arr, key = cache.load_GDV(labels, A, graphlet_nodes)
+        if GDV_arr is None:
+            if backend == 'graco':
+                if graphlet_nodes != 4:
+                    raise Exception(f"Backend graco can't count "
+                                    f"{graphlet_nodes}-node graphlets!")
+                GDV_arr = counting.orbit_counts(A, n_jobs  = n_jobs,
+                                                   nodes   = positions,
+                                                   degrees = degrees)
+            elif backend == 'orca':
+                GDV_arr = Calculate._orca_orbits(A, graphlet_nodes)
+                if positions is not None:
+                    GDV_arr = GDV_arr[positions]
+            else:
+                raise Exception(f"Backend {backend} not known!")
+            cache.store_GDV(key, GDV_arr)
 
         if   dtype == pd.DataFrame:
-            columnn_names = list(map(str,range(15)))
-            df = pd.DataFrame(GDV_arr, columns=columnn_names)
+            n_orbits = NUMBER_OF_ORBITS[graphlet_nodes]
+            columnn_names = list(map(str,range(n_orbits)))
+            index = labels if nodes is None else list(nodes)
+            df = pd.DataFrame(GDV_arr, index=index, columns=columnn_names)
             df.columns.name = 'Orbit'
-            return df.rename(index=reverse_mapping)
+            return df
 
         elif dtype == np.ndarray:
             return GDV_arr
@@ -100,110 +314,125 @@ class Calculate:
             raise TypeError('Please provide an appropriate type.')
 
     @staticmethod
-    def coefficients(G, dtype=pd.DataFrame):
-        if   type(G) == pd.DataFrame:
-            GDV = G
-        elif type(G) == np.ndarray:
-            GDV = pd.DataFrame(G, columns=map(str,range(15)))
-        elif type(G) == nx.Graph:
-            GDV = Calculate.orbits(G)
-        else:
-            raise TypeError('Please provide an appropriate type.')
-
-        GCV = pd.DataFrame({
-            ('D','0','2') : 2*GDV['2']  / (GDV['0'] * (GDV['0']-1)),
-            ('D','0','3') : 2*GDV['3']  / (GDV['0'] * (GDV['0']-1)),
-
-            ('D','1','5') : 1*GDV['5' ] / (GDV['1'] * (GDV['0']-1)),
-            ('D','1','8') : 2*GDV['8' ] / (GDV['1'] * (GDV['0']-1)),
-            ('D','1','10'): 1*GDV['10'] / (GDV['1'] * (GDV['0']-1)),
-            ('D','1','12'): 2*GDV['12'] / (GDV['1'] * (GDV['0']-1)),
-
-            ('D','2','7') : 3*GDV['7']  / (GDV['2'] * (GDV['0']-2)),
-            ('D','2','11'): 2*GDV['11'] / (GDV['2'] * (GDV['0']-2)),
-            ('D','2','13'): 1*GDV['13'] / (GDV['2'] * (GDV['0']-2)),
-
-            ('D','3','11'): 1*GDV['11'] / (GDV['3'] * (GDV['0']-2)),
-            ('D','3','13'): 2*GDV['13'] / (GDV['3'] * (GDV['0']-2)),
-            ('D','3','14'): 3*GDV['14'] / (GDV['3'] * (GDV['0']-2)),
-
-
-            ('A', '0', '1') : 1*GDV['1'] / (GDV['1'] + 2*GDV['3']),
-            ('A', '0', '3') : 2*GDV['3'] / (GDV['1'] + 2*GDV['3']),
-
-            ('A', '1', '4')  : 1*GDV['4']  / (1*GDV['4'] + 2*GDV['8'] + 1*GDV['10'] + 2*GDV['13']),
-            ('A', '1', '8')  : 2*GDV['8']  / (1*GDV['4'] + 2*GDV['8'] + 1*GDV['10'] + 2*GDV['13']),
-            ('A', '1', '10') : 1*GDV['10'] / (1*GDV['4'] + 2*GDV['8'] + 1*GDV['10'] + 2*GDV['13']),
-            ('A', '1', '13') : 2*GDV['13'] / (1*GDV['4'] + 2*GDV['8'] + 1*GDV['10'] + 2*GDV['13']),
-
-            ('A', '2', '6')  : 1*GDV['6']  / (1*GDV['6'] + 1*GDV['10'] + 1*GDV['13']),
-            ('A', '2', '10') : 1*GDV['10'] / (1*GDV['6'] + 1*GDV['10'] + 1*GDV['13']),
-            ('A', '2', '13') : 1*GDV['13'] / (1*GDV['6'] + 1*GDV['10'] + 1*GDV['13']),
-
-            ('A', '3', '9')  : 1*GDV['9']  / (1*GDV['9'] + 2*GDV['12'] + 3*GDV['14']),
-            ('A', '3', '12') : 2*GDV['12'] / (1*GDV['9'] + 2*GDV['12'] + 3*GDV['14']),
-            ('A', '3', '14') : 3*GDV['14'] / (1*GDV['9'] + 2*GDV['12'] + 3*GDV['14']),
-
-
-            ('G', '0-0', '1') : 1*GDV['1'] / (GDV['1'] + 2*GDV['3']),
-            ('G', '0-0', '3') : 2*GDV['3'] / (GDV['1'] + 2*GDV['3']),
-
-            ('G', '1-1', '4')  : 1*GDV['4']  / (1*GDV['4'] + 2*GDV['8'] + 2*GDV['9'] + 2*GDV['12']),
-            ('G', '1-1', '8')  : 2*GDV['8']  / (1*GDV['4'] + 2*GDV['8'] + 2*GDV['9'] + 2*GDV['12']),
-            ('G', '1-1', '9')  : 2*GDV['9']  / (1*GDV['4'] + 2*GDV['8'] + 2*GDV['9'] + 2*GDV['12']),
-            ('G', '1-1', '12') : 2*GDV['12'] / (1*GDV['4'] + 2*GDV['8'] + 2*GDV['9'] + 2*GDV['12']),
-
-            ('G', '1-2', '6')  : 2*GDV['6']  / (2*GDV['6']  + 1*GDV['10'] + 2*GDV['9']  + 2*GDV['12']),
-            ('G', '1-2', '9')  : 2*GDV['9']  / (2*GDV['6']  + 1*GDV['10'] + 2*GDV['9']  + 2*GDV['12']),
-            ('G', '1-2', '10') : 1*GDV['10'] / (2*GDV['6']  + 1*GDV['10'] + 2*GDV['9']  + 2*GDV['12']),
-            ('G', '1-2', '12') : 2*GDV['12'] / (2*GDV['6']  + 1*GDV['10'] + 2*GDV['9']  + 2*GDV['12']),
-
-            ('G', '2-1', '5')  : 1*GDV['5']  / (1*GDV['5']  + 2*GDV['11'] + 2*GDV['8']  + 2*GDV['13']),
-            ('G', '2-1', '8')  : 2*GDV['8']  / (1*GDV['5']  + 2*GDV['11'] + 2*GDV['8']  + 2*GDV['13']),
-            ('G', '2-1', '11') : 2*GDV['11'] / (1*GDV['5']  + 2*GDV['11'] + 2*GDV['8']  + 2*GDV['13']),
-            ('G', '2-1', '13') : 2*GDV['13'] / (1*GDV['5']  + 2*GDV['11'] + 2*GDV['8']  + 2*GDV['13']),
-
-            ('G', '3-3', '10') : 1*GDV['10'] / (1*GDV['10'] + 2*GDV['12'] + 6*GDV['14'] + 2*GDV['13']),
-            ('G', '3-3', '12') : 2*GDV['12'] / (1*GDV['10'] + 2*GDV['12'] + 6*GDV['14'] + 2*GDV['13']),
-            ('G', '3-3', '13') : 2*GDV['13'] / (1*GDV['10'] + 2*GDV['12'] + 6*GDV['14'] + 2*GDV['13']),
-            ('G', '3-3', '14') : 6*GDV['14'] / (1*GDV['10'] + 2*GDV['12'] + 6*GDV['14'] + 2*GDV['13']),
-
-
-            ('O', 'G2-a', '12') : 1*GDV['12'] / (1*GDV['12'] + 3*GDV['14']),
-            ('O', 'G2-a', '14') : 3*GDV['14'] / (1*GDV['12'] + 3*GDV['14']),
-
-            ('O', 'G2-b', '13') : 2*GDV['13'] / (2*GDV['13'] + 6*GDV['14']),
-            ('O', 'G2-b', '14') : 6*GDV['14'] / (2*GDV['13'] + 6*GDV['14']),
-
-            ('O', 'G2-c', '10') : 1*GDV['10'] / (1*GDV['10'] + 2*GDV['13']),
-            ('O', 'G2-c', '13') : 2*GDV['13'] / (1*GDV['10'] + 2*GDV['13']),
-
-            ('O', 'G2-d', '11') : 2*GDV['11'] / (2*GDV['11'] + 2*GDV['13']),
-            ('O', 'G2-d', '13') : 2*GDV['13'] / (2*GDV['11'] + 2*GDV['13']),
+    def orbits_many(graphs, n_jobs=-1, stream=False, **kwargs):
+        """
+        Calculates the orbits of a list or dict of graphs in a pool of
+        processes, largest graphs first. kwargs are passed to
+        Calculate.orbits. Returns a dict of GDVs and a dict of the seconds
+        every graph took, both keyed like `graphs`. With stream=True, a
+        generator of (key, GDV, seconds) is returned instead that yields
+        every graph as soon as it is finished.
+        """
+        return _many('orbits', graphs, n_jobs, stream, kwargs)
 
-            ('O', 'G1-a', '7')  : 6*GDV['7']  / (6*GDV['7'] + 2*GDV['11']),
-            ('O', 'G1-a', '11') : 2*GDV['11'] / (6*GDV['7'] + 2*GDV['11']),
+    @staticmethod
+    def coefficients_many(graphs, n_jobs=-1, stream=False, **kwargs):
+        """
+        Like Calculate.orbits_many, for Calculate.coefficients.
+        """
+        return _many('coefficients', graphs, n_jobs, stream, kwargs)
 
-            ('O', 'G1-b', '5') : 1*GDV['5'] / (1*GDV['5'] + 2*GDV['8']),
-            ('O', 'G1-b', '8') : 2*GDV['8'] / (1*GDV['5'] + 2*GDV['8']),
+    @staticmethod
+    def sampled_orbits(G, rel_error=0.05, time_budget=None, confidence=0.95,
+                          sample_rate=None, seed=None, n_jobs=1, labels=None,
+                          max_replicates=100):
+        """
+        Estimates the orbits of large graphs from edge-sampled replicates,
+        see graco.sampling. Returns the estimated GDV and the half-widths of
+        the confidence intervals of every entry, both in the layout of
+        Calculate.orbits.
+
+        rel_error bounds every orbit as a whole: replicates are drawn until
+        the half-widths of each orbit, summed over all nodes, are at most
+        rel_error times its summed estimates. Single entries, typically of
+        nodes with few copies of a rare orbit, can have wider intervals.
+        Sampling stops earlier after max_replicates replicates or
+        time_budget seconds.
+        """
+        A, labels = to_adjacency(G, labels)
+        GDV_arr, half_width = sampling.sampled_orbit_counts(A,
+                                        rel_error      = rel_error,
+                                        time_budget    = time_budget,
+                                        p              = sample_rate,
+                                        confidence     = confidence,
+                                        seed           = seed,
+                                        n_jobs         = n_jobs,
+                                        max_replicates = max_replicates)
+        columnn_names = list(map(str,range(15)))
+        dfs = []
+        for arr in [GDV_arr, half_width]:
+            df = pd.DataFrame(arr, index=labels, columns=columnn_names)
+            df.columns.name = 'Orbit'
+            dfs.append(df)
+        return tuple(dfs)
 
-            ('O', 'G1-c', '6') : 2*GDV['6'] / (2*GDV['6'] + 2*GDV['9']),
-            ('O', 'G1-c', '9') : 2*GDV['9'] / (2*GDV['6'] + 2*GDV['9']),
+    @staticmethod
+    def _orca_orbits(A, graphlet_nodes=4):
+        return run_orca(_edge_array(A), A.shape[0], graphlet_nodes)
 
-            ('O', 'G1-d', '9')  : 2*GDV['9']  / (2*GDV['9'] + 2*GDV['12']),
-            ('O', 'G1-d', '12') : 2*GDV['12'] / (2*GDV['9'] + 2*GDV['12']),
+    @staticmethod
+    def coefficients(G, dtype=pd.DataFrame, graphlet_nodes=4, labels=None,
+                        nodes=None):
+        """
+        G is a GDV, or a graph in any form accepted by Calculate.orbits,
+        optionally restricted to `nodes`.
+        The equations are listed in graco.graphlets. A GDV with 73 orbits
+        (or graphlet_nodes=5 for graphs) adds those of the 5-node graphlets.
+        """
+        key = None
+        if   type(G) == pd.DataFrame:
+            GDV = G
+        elif type(G) == np.ndarray and G.shape[1] != 2:
+            GDV = pd.DataFrame(G, columns=map(str,range(G.shape[1])))
+        elif type(G) == DynamicGDV:
+            return _GCV_as(G.coefficients(), dtype)
+        elif nodes is not None:
+            GDV = Calculate.orbits(G, graphlet_nodes = graphlet_nodes,
+                                      labels         = labels,
+                                      nodes          = nodes)
+        else:
+            A, labels = to_adjacency(G, labels)
+            GCV, key = cache.load_GCV(labels, A, graphlet_nodes)
+            if GCV is not None:
+                return _GCV_as(GCV, dtype)
+            GDV = Calculate.orbits(A, graphlet_nodes = graphlet_nodes,
+                                      labels         = labels)
 
-            ('O', 'G1-e', '4') : 1*GDV['4'] / (1*GDV['4'] + 2*GDV['8']),
-            ('O', 'G1-e', '8') : 2*GDV['8'] / (1*GDV['4'] + 2*GDV['8']),
+        GCV = graphlets.coefficient_array(GDV)
+        cache.store_GCV(key, GCV)
+        return _GCV_as(GCV, dtype)
 
-            ('O', 'G1-f', '8')  : 2*GDV['8']  / (2*GDV['8'] + 2*GDV['12']),
-            ('O', 'G1-f', '12') : 2*GDV['12'] / (2*GDV['8'] + 2*GDV['12']),
-        })
-        GCV.columns.name  = 'Coefficient'
-        GCV.columns.names = ['Group', 'Equation', 'Orbit']
-        if   dtype == pd.DataFrame:
-            return GCV.sort_index(axis=1)
-        elif dtype == np.ndarray:
-            return np.genfromtxt(file_in)
+    @staticmethod
+    def features(G, name, dtype=pd.DataFrame, graphlet_nodes=4, labels=None,
+                    n_jobs=1):
+        """
+        Feature set `name` of graco.feature_sets, or 'GDV' for the orbits, of
+        a graph in any form accepted by Calculate.orbits. Only the orbits that
+        the selected equations use are counted: degrees and triangles if they
+        stay within 3-node graphlets, the 5-node orbits only if needed.
+        The GCV columns keep the levels (Group, Equation, Orbit).
+        """
+        if name == 'GDV':
+            return Calculate.orbits(G, dtype          = dtype,
+                                       graphlet_nodes = graphlet_nodes,
+                                       labels         = labels,
+                                       n_jobs         = n_jobs)
+
+        A, labels = to_adjacency(G, labels)
+        equations = feature_sets.equations(name, graphlet_nodes)
+        if not equations:
+            raise Exception(f"Feature {name} has no equations!")
+        n_orbits = feature_sets.orbits(name, graphlet_nodes)[-1] + 1
+
+        if n_orbits <= 4:
+            GDV_arr, key = cache.load_GDV(labels, A)
+            if GDV_arr is None:
+                GDV_arr = counting.three_node_orbit_counts(A, n_jobs=n_jobs)
+            GDV = pd.DataFrame(GDV_arr[:,:4], index   = labels,
+                                              columns = list('0123'))
         else:
-            raise TypeError('Please provide an appropriate type.')
+            GDV = Calculate.orbits(A, graphlet_nodes = 4 if n_orbits <= 15
+                                                         else 5,
+                                      labels         = labels,
+                                      n_jobs         = n_jobs)
+        return _GCV_as(graphlets.coefficient_array(GDV, equations), dtype)
@@ -0,0 +1,121 @@
+"""
+Graphlet correlation matrices (GCM) and a store of them for comparing one
+network with many.
+
+The GCM of a network holds the correlations between its orbits across all
+nodes, with an additional 'NULL' node that has 1 in every orbit (as in
+GDV_to_GCM11). GCMs are kept as condensed upper triangles, so the GCD of two
+networks is the distance of two vectors and the GCDs of one network to all
+stored networks are a single cdist.
+
+    store = graco.gcm.GCMStore(orbits=11)
+    store.add_many({'yeast':G1, 'human':G2, 'fly':G3})
+    store.save('GCMs.npz')
+    store.query(G)          # GCD11 to every stored network
+"""
+
+from scipy.spatial.distance import cdist
+from graco.functions import Calculate
+
+import scipy.stats
+import pandas as pd
+import numpy as np
+
+# orbits of the GCM variants; GCM11 leaves out the redundant orbits
+ORBITS = {11: [0,1,2,4,5,6,7,8,9,10,11],
+          15: list(range(15))}
+
+
+def correlations(X, method='pearson'):
+    """
+    Condensed correlation matrix of the columns of X. Columns without
+    variance give NaN, like pandas' corr.
+    """
+    X = np.asarray(X, dtype=float)
+    if   method == 'spearman':
+        X = scipy.stats.rankdata(X, axis=0)
+    elif method != 'pearson':
+        raise Exception(f"Method {method} not known!")
+
+    X = X - X.mean(axis=0)
+    norm = np.sqrt(np.einsum('ij,ij->j', X, X))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        X = X / norm
+    C = np.clip(X.T @ X, -1, 1)
+    return C[np.triu_indices(len(C), 1)]
+
+def GCM(GDV, orbits=11, method='pearson'):
+    """
+    Condensed GCM of a GDV (DataFrame or array with 15 orbit columns) for
+    the orbits of ORBITS[orbits].
+    """
+    if orbits not in ORBITS:
+        raise Exception(f"GCM with {orbits} orbits not known!")
+    X = np.asarray(GDV, dtype=float)[:, ORBITS[orbits]]
+    return correlations(np.vstack([X, np.ones(X.shape[1])]), method)
+
+
+class GCMStore:
+    """
+    GCMs of a collection of networks, keyed by name.
+    """
+    def __init__(self, orbits=11, method='pearson'):
+        self.orbits = orbits
+        self.method = method
+        self.names  = []
+        self.GCMs   = np.zeros((0, len(ORBITS[orbits])*(len(ORBITS[orbits])-1)
+                                                                        // 2))
+
+    def __len__(self):
+        return len(self.names)
+
+    def GCM(self, G):
+        return GCM(Calculate.orbits(G, dtype=np.ndarray), self.orbits,
+                                                          self.method)
+
+    def add(self, name, G):
+        self.add_GCMs([name], [self.GCM(G)])
+
+    def add_many(self, graphs, n_jobs=-1):
+        """
+        Adds a dict of graphs, counting their orbits in parallel with
+        Calculate.orbits_many.
+        """
+        GDVs, _ = Calculate.orbits_many(graphs, n_jobs=n_jobs,
+                                                dtype=np.ndarray)
+        self.add_GCMs(list(GDVs), [GCM(GDV, self.orbits, self.method)
+                                            for GDV in GDVs.values()])
+
+    def add_GCMs(self, names, GCMs):
+        self.names = self.names + list(names)
+        self.GCMs  = np.vstack([self.GCMs, np.asarray(GCMs, dtype=float)])
+
+    def query(self, G, metric='euclidean'):
+        """
+        Distances (GCD for 'euclidean') of a graph, or of its condensed GCM,
+        to every stored network as a Series.
+        """
+        query = G if type(G) == np.ndarray and G.ndim == 1 else self.GCM(G)
+        D = cdist(query.reshape(1,-1), self.GCMs, metric)[0]
+        return pd.Series(D, index=self.names)
+
+    def distance_matrix(self, metric='euclidean'):
+        return pd.DataFrame(cdist(self.GCMs, self.GCMs, metric),
+                            index=self.names, columns=self.names)
+
+    def save(self, path):
+        """
+        Writes the store into a single .npz file, names are stored as
+        strings.
+        """
+        np.savez(path, names  = np.array(list(map(str, self.names)), dtype=str),
+                       GCMs   = self.GCMs,
+                       orbits = self.orbits,
+                       method = self.method)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            store = cls(int(f['orbits']), str(f['method']))
+            store.add_GCMs(f['names'].tolist(), f['GCMs'])
+        return store
@@ -0,0 +1,150 @@
+"""
+Array-backed GCV container.
+
+The coefficients are kept in a single C-contiguous (nodes, columns) float
+array whose columns are sorted by (group, equation, orbit), so that every
+group and every equation is a contiguous block of columns. Selecting one of
+them returns a view of the array; the pandas DataFrame of Calculate.
+coefficients is only built when asked for.
+
+    GCV = graco.coefficients(G, dtype=graco.GCVArray)
+    GCV.group('D')              # (N, columns of D) view
+    GCV.equation('G', '1-1')    # (N, 4) view
+    GCV.to_frame()              # DataFrame with (Group, Equation, Orbit)
+"""
+
+import pandas as pd
+import numpy as np
+
+
+class GCVArray:
+    """
+    GCV given by the (N, columns) array `values`, the node labels `index`
+    and the column tuples `columns`. The columns must be grouped by
+    everything but their last level (the orbit), as they are after sorting.
+    """
+    def __init__(self, values, index, columns, names=None):
+        self.values  = np.asarray(values, dtype=float)
+        self.index   = pd.Index(index)
+        self._tuples = [tuple(map(str, column)) for column in columns]
+        self._names  = names
+        self._columns = None
+        self._frame   = None
+
+        self.equations = []
+        self._position = {}
+        offsets = []
+        for n, column in enumerate(self._tuples):
+            eq = column[:-1]
+            if not self.equations or self.equations[-1] != eq:
+                if eq in self._position:
+                    raise Exception(f"Columns of equation {eq} "
+                                     "are not contiguous!")
+                self._position[eq] = len(self.equations)
+                self.equations.append(eq)
+                offsets.append(n)
+        offsets.append(len(self._tuples))
+        self.offsets = np.array(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, GCV):
+        GCV = GCV.sort_index(axis=1)
+        return cls(GCV.to_numpy(dtype=float), GCV.index,
+                   GCV.columns.tolist(), names=GCV.columns.names)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            names = self._names
+            if names is None and self._tuples and len(self._tuples[0]) == 3:
+                names = ['Group', 'Equation', 'Orbit']
+            self._columns = pd.MultiIndex.from_tuples(self._tuples,
+                                                      names=names)
+        return self._columns
+
+    def _span(self, equations):
+        positions = [self._position[eq] for eq in equations]
+        return self.offsets[min(positions)], self.offsets[max(positions)+1]
+
+    def group(self, group):
+        """
+        Coefficients of all equations of `group` as a view.
+        """
+        equations = [eq for eq in self.equations if eq[0] == group]
+        if not equations:
+            raise Exception(f"Group {group} not known!")
+        start, stop = self._span(equations)
+        return self.values[:, start:stop]
+
+    def equation(self, *equation):
+        """
+        Coefficients of a single equation, e.g. equation('D', '1'), as a view.
+        """
+        if equation not in self._position:
+            raise Exception(f"Equation {equation} not known!")
+        n = self._position[equation]
+        return self.values[:, self.offsets[n]:self.offsets[n+1]]
+
+    def orbits(self, *equation):
+        """
+        Orbit labels of the columns of an equation.
+        """
+        n = self._position[equation]
+        return [column[-1] for column in
+                        self._tuples[self.offsets[n]:self.offsets[n+1]]]
+
+    def iter_equations(self):
+        """
+        Yields every equation and its coefficients as a view.
+        """
+        for n, eq in enumerate(self.equations):
+            yield eq, self.values[:, self.offsets[n]:self.offsets[n+1]]
+
+    def select(self, groups=None, drop=()):
+        """
+        Returns a GCVArray of the equations in `groups` (all by default)
+        without the equations in `drop`, e.g.
+        select(['D','G'], drop=[('G','2-1')]). The values are a view if the
+        selected equations are contiguous and a copy otherwise.
+        """
+        drop = {tuple(eq) for eq in drop}
+        positions = [n for n,eq in enumerate(self.equations)
+                        if (groups is None or eq[0] in groups)
+                        and eq not in drop]
+        if not positions:
+            raise Exception(f"No equations of {groups} selected!")
+
+        blocks = []
+        for n in positions:
+            start, stop = self.offsets[n], self.offsets[n+1]
+            if blocks and blocks[-1][1] == start:
+                blocks[-1][1] = stop
+            else:
+                blocks.append([start, stop])
+
+        if len(blocks) == 1:
+            values = self.values[:, blocks[0][0]:blocks[0][1]]
+        else:
+            values = np.concatenate([self.values[:, start:stop]
+                                        for start, stop in blocks], axis=1)
+        tuples = [column for start, stop in blocks
+                         for column in self._tuples[start:stop]]
+        return GCVArray(values, self.index, tuples, names=self._names)
+
+    def to_frame(self):
+        """
+        The GCV as a DataFrame in the layout of Calculate.coefficients. The
+        frame shares its memory with `values` and is built only once.
+        """
+        if self._frame is None:
+            self._frame = pd.DataFrame(self.values, index   = self.index,
+                                                    columns = self.columns,
+                                                    copy    = False)
+        return self._frame
@@ -0,0 +1,250 @@
+"""
+The graphlets on 2 to 5 nodes with the orbit numbering of ORCA, and the
+coefficient equations of Calculate.coefficients: the equations of the 2-4
+node graphlets, and those that relate the orbits of 4-node graphlets to the
+orbits of 5-node graphlets.
+
+The equations follow the groups of Calculate.coefficients:
+    D   a further neighbour of the node is added to the graphlet,
+    A   the node is attached to a graphlet that it is not part of,
+    G   a further node is attached to another node of the graphlet,
+    O   a single edge is added to the graphlet.
+The weight of an orbit counts the ways in which one of its graphlets arises
+from the base orbit, which makes every equation a distribution.
+"""
+
+from itertools import combinations, permutations
+from collections import defaultdict
+from graco.gcv import GCVArray
+
+import pandas as pd
+import numpy as np
+
+# (edges, orbit of every node), as reported by ORCA
+GRAPHLETS = [
+    ([(0,1)], (0,0)),
+
+    ([(0,1), (0,2)], (2,1,1)),
+    ([(0,1), (0,2), (1,2)], (3,3,3)),
+
+    ([(0,3), (1,3), (2,3)], (6,6,6,7)),
+    ([(0,1), (0,3), (1,2)], (5,5,4,4)),
+    ([(0,3), (1,2), (1,3), (2,3)], (9,10,10,11)),
+    ([(0,1), (0,3), (1,2), (2,3)], (8,8,8,8)),
+    ([(0,1), (0,2), (0,3), (1,2), (2,3)], (13,12,13,12)),
+    ([(0,1), (0,2), (0,3), (1,2), (1,3), (2,3)], (14,14,14,14)),
+
+    ([(0,4), (1,4), (2,4), (3,4)], (22,22,22,22,23)),
+    ([(0,4), (1,3), (2,3), (3,4)], (18,19,19,21,20)),
+    ([(0,1), (0,4), (1,2), (2,3)], (16,17,16,15,15)),
+    ([(0,4), (1,4), (2,3), (2,4), (3,4)], (31,31,32,32,33)),
+    ([(0,1), (0,2), (0,4), (1,2), (2,3)], (26,25,26,24,24)),
+    ([(0,4), (1,2), (1,3), (2,3), (3,4)], (27,29,29,30,28)),
+    ([(0,1), (1,3), (1,4), (2,3), (2,4)], (35,38,36,37,37)),
+    ([(0,1), (0,4), (1,2), (2,3), (3,4)], (34,34,34,34,34)),
+    ([(0,1), (1,2), (1,3), (1,4), (2,3), (2,4)], (39,42,41,40,40)),
+    ([(0,1), (1,3), (1,4), (2,3), (2,4), (3,4)], (45,47,46,48,48)),
+    ([(0,1), (0,4), (1,4), (2,3), (2,4), (3,4)], (43,43,43,43,44)),
+    ([(0,1), (0,3), (0,4), (1,2), (2,3), (3,4)], (53,51,51,53,52)),
+    ([(0,2), (0,3), (0,4), (1,2), (1,3), (1,4)], (50,50,49,49,49)),
+    ([(0,4), (1,2), (1,3), (1,4), (2,3), (2,4), (3,4)], (56,57,57,57,58)),
+    ([(0,3), (0,4), (1,3), (1,4), (2,3), (2,4), (3,4)], (54,54,54,55,55)),
+    ([(0,1), (0,4), (1,2), (1,3), (1,4), (2,3), (3,4)], (59,61,59,60,60)),
+    ([(0,2), (0,3), (0,4), (1,2), (1,3), (1,4), (2,4)], (63,63,64,62,64)),
+    ([(0,1), (0,3), (0,4), (1,3), (1,4), (2,3), (2,4), (3,4)], (66,66,65,67,67)),
+    ([(0,1), (0,3), (0,4), (1,2), (1,4), (2,3), (2,4), (3,4)], (68,68,68,68,69)),
+    ([(0,1), (0,3), (0,4), (1,2), (1,3), (1,4), (2,3), (2,4), (3,4)],
+                                                            (70,71,70,71,71)),
+    ([(0,1), (0,2), (0,3), (0,4), (1,2), (1,3), (1,4), (2,3), (2,4), (3,4)],
+                                                            (72,72,72,72,72)),
+]
+
+
+def _relabelled_orbits():
+    """
+    Orbits of every labelled connected graph on 2 to 5 nodes, keyed by its
+    number of nodes and sorted edge tuple.
+    """
+    table = {}
+    for edges, orbits in GRAPHLETS:
+        n = len(orbits)
+        for perm in permutations(range(n)):
+            key = (n, tuple(sorted(tuple(sorted((perm[u],perm[v])))
+                                                        for u,v in edges)))
+            relabelled = [0]*n
+            for node, orbit in enumerate(orbits):
+                relabelled[perm[node]] = orbit
+            table[key] = tuple(relabelled)
+    return table
+
+_ORBITS = _relabelled_orbits()
+
+def orbits(nodes, edges):
+    """
+    Returns the orbit of every node of the graph (nodes, edges) as a dict, or
+    None if the graph is not a graphlet (disconnected).
+    """
+    nodes = sorted(nodes)
+    index = {node:n for n,node in enumerate(nodes)}
+    key = (len(nodes), tuple(sorted(tuple(sorted((index[u],index[v])))
+                                                        for u,v in edges)))
+    orbit = _ORBITS.get(key)
+    return None if orbit is None else dict(zip(nodes, orbit))
+
+def degree_in_graphlet(orbit):
+    for edges, orbits in GRAPHLETS:
+        if orbit in orbits:
+            node = orbits.index(orbit)
+            return sum(node in edge for edge in edges)
+
+
+# (group, equation, weight of every orbit)
+EQUATIONS4 = [
+    ('D', '0',    {2:2, 3:2}),
+    ('D', '1',    {5:1, 8:2, 10:1, 12:2}),
+    ('D', '2',    {7:3, 11:2, 13:1}),
+    ('D', '3',    {11:1, 13:2, 14:3}),
+
+    ('A', '0',    {1:1, 3:2}),
+    ('A', '1',    {4:1, 8:2, 10:1, 13:2}),
+    ('A', '2',    {6:1, 10:1, 13:1}),
+    ('A', '3',    {9:1, 12:2, 14:3}),
+
+    ('G', '0-0',  {1:1, 3:2}),
+    ('G', '1-1',  {4:1, 8:2, 9:2, 12:2}),
+    ('G', '1-2',  {6:2, 9:2, 10:1, 12:2}),
+    ('G', '2-1',  {5:1, 8:2, 11:2, 13:2}),
+    ('G', '3-3',  {10:1, 12:2, 13:2, 14:6}),
+
+    ('O', 'G2-a', {12:1, 14:3}),
+    ('O', 'G2-b', {13:2, 14:6}),
+    ('O', 'G2-c', {10:1, 13:2}),
+    ('O', 'G2-d', {11:2, 13:2}),
+    ('O', 'G1-a', {7:6, 11:2}),
+    ('O', 'G1-b', {5:1, 8:2}),
+    ('O', 'G1-c', {6:2, 9:2}),
+    ('O', 'G1-d', {9:2, 12:2}),
+    ('O', 'G1-e', {4:1, 8:2}),
+    ('O', 'G1-f', {8:2, 12:2}),
+]
+
+
+def _weights(graphlet_nodes):
+    """
+    D, A, G and O equations between the orbits of (graphlet_nodes-1)- and
+    graphlet_nodes-node graphlets, in the format of EQUATIONS4.
+    """
+    D = defaultdict(lambda: defaultdict(int))
+    A = defaultdict(lambda: defaultdict(int))
+    G = defaultdict(lambda: defaultdict(int))
+    O = defaultdict(lambda: defaultdict(int))
+
+    def add(weights, equation, orbit):
+        weights[equation][orbit] += 1
+
+    for edges, graphlet_orbits in GRAPHLETS:
+        nodes = range(len(graphlet_orbits))
+        if len(nodes) != graphlet_nodes:
+            continue
+        for orbit in sorted(set(graphlet_orbits)):
+            u = graphlet_orbits.index(orbit)
+
+            # removing a node
+            for x in nodes:
+                rest = [edge for edge in edges if x not in edge]
+                sub  = orbits(set(nodes) - {x}, rest)
+                if sub is None:
+                    continue
+                if x == u:
+                    for v in nodes:
+                        if tuple(sorted((u,v))) in edges:
+                            add(A, str(sub[v]), orbit)
+                    continue
+                if tuple(sorted((u,x))) in edges:
+                    add(D, str(sub[u]), orbit)
+                for v in nodes:
+                    if v != u and tuple(sorted((x,v))) in edges:
+                        add(G, f"{sub[u]}-{sub[v]}", orbit)
+
+            # removing an edge and adding a non-edge
+            for pair in combinations(nodes, 2):
+                if pair in edges:
+                    sub = orbits(nodes, [edge for edge in edges
+                                                        if edge != pair])
+                    if sub is not None:
+                        O[f"{sub[u]}-{orbit}"][orbit] += 1
+                else:
+                    sup = orbits(nodes, edges + [pair])
+                    O[f"{orbit}-{sup[u]}"][orbit] += 1
+
+    weights = {'D':D, 'A':A, 'G':G, 'O':O}
+    return [(group, equation, dict(terms))
+                for group in ['D', 'A', 'G', 'O']
+                for equation, terms in sorted(weights[group].items())]
+
+EQUATIONS5 = _weights(5)
+
+
+def coefficient_matrices(equations, n_orbits):
+    """
+    Returns the sorted GCV columns as a MultiIndex and the (n_orbits,
+    columns) weights of their numerators and denominators. The denominator
+    of an equation is the weighted sum of its orbits. For the D equations,
+    this equals the number of ways to extend the base orbit, e.g.
+    GDV['1']*(GDV['0']-1) for D-1.
+    """
+    terms = {(group, equation):terms for group, equation, terms in equations}
+    columns = sorted((group, equation, str(orbit))
+                        for (group, equation), weights in terms.items()
+                        for orbit in weights)
+
+    numerator   = np.zeros((n_orbits, len(columns)))
+    denominator = np.zeros((n_orbits, len(columns)))
+    for n, (group, equation, orbit) in enumerate(columns):
+        weights = terms[(group, equation)]
+        numerator[int(orbit), n] = weights[int(orbit)]
+        for other, weight in weights.items():
+            denominator[other, n] = weight
+
+    columns = pd.MultiIndex.from_tuples(columns,
+                                        names=['Group', 'Equation', 'Orbit'])
+    return columns, numerator, denominator
+
+_MATRICES = {15: coefficient_matrices(EQUATIONS4, 15),
+             73: coefficient_matrices(EQUATIONS4 + EQUATIONS5, 73)}
+
+
+def coefficient_array(GDV, equations=None):
+    """
+    Returns the GCV of a GDV DataFrame with 15 or 73 orbits as a GCVArray.
+    The default equations are EQUATIONS4, plus EQUATIONS5 for 73 orbits.
+    With given equations, the GDV only needs the orbits up to the largest
+    one that they use. Coefficients with a zero denominator are NaN.
+    """
+    if equations is None:
+        n_orbits = 73 if '72' in GDV.columns else 15
+        matrices = _MATRICES[n_orbits]
+    else:
+        n_orbits = 1 + max(orbit for group, equation, terms in equations
+                                 for orbit in terms)
+        matrices = coefficient_matrices(equations, n_orbits)
+    columns, numerator, denominator = matrices
+
+    orbits = list(map(str,range(n_orbits)))
+    if list(GDV.columns) == orbits:
+        X = GDV.to_numpy(dtype=float)
+    else:
+        X = GDV[orbits].to_numpy(dtype=float)
+    GCV_arr = X @ numerator
+    denom   = X @ denominator
+    with np.errstate(divide='ignore', invalid='ignore'):
+        GCV_arr /= denom
+    GCV_arr[denom == 0] = np.nan
+    return GCVArray(GCV_arr, GDV.index, columns.tolist(), names=columns.names)
+
+def coefficients(GDV, equations=None):
+    """
+    Returns the GCV of a GDV DataFrame, see coefficient_array, as a DataFrame
+    with the column levels (group, equation, orbit).
+    """
+    return coefficient_array(GDV, equations).to_frame()
@@ -0,0 +1,87 @@
+"""
+k nearest neighbours without distance matrices.
+
+The distances are computed on tiles of rows against blocks of columns, and
+every row keeps only its k closest columns so far, so that memory stays in
+O(N*k) plus one tile. The metrics are those of graco.distance_matrix; a GCV
+(DataFrame with (Group, Equation, Orbit) columns or GCVArray) is compared
+equation-wise as in graco.GCV_distance_matrix.
+
+    indices, distances = graco.knn(GCV, 'hellinger', k=10)
+    GCV.index[indices[0]]       # the 10 nodes closest to the first node
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from graco.gcv import GCVArray
+
+import graco.distance_matrices
+import pandas as pd
+import numpy as np
+import math
+import os
+
+
+def _merge(best_D, best_I, D, I, k):
+    """
+    k smallest distances per row of the current neighbours and a new block.
+    """
+    D = np.hstack([best_D, D])
+    I = np.hstack([best_I, I])
+    nearest = np.argpartition(D, k-1, axis=1)[:, :k]
+    return (np.take_along_axis(D, nearest, axis=1),
+            np.take_along_axis(I, nearest, axis=1))
+
+def knn(features, metric, k, n_jobs=1, tile_size=None):
+    """
+    Indices and distances of the k nearest neighbours of every row of
+    `features`, both as (N,k) arrays sorted by distance. A row is not its
+    own neighbour. Missing distances, i.e. pairs of nodes without a common
+    equation in a GCV, are never neighbours; rows with fewer than k
+    neighbours are filled up with index -1 and distance inf. Tiles of
+    tile_size rows and columns are computed by n_jobs threads.
+    """
+    if isinstance(features, GCVArray) or \
+            (type(features) == pd.DataFrame and
+             type(features.columns) == pd.MultiIndex):
+        if not isinstance(features, GCVArray):
+            features = GCVArray.from_frame(features)
+        X, kernel, _ = graco.distance_matrices._GCV_metric_kernel(metric,
+                                                                  features)
+    else:
+        X, kernel = graco.distance_matrices._metric_kernel(metric,
+                                np.asarray(features, dtype=float))
+
+    N = len(X)
+    if not 0 < k < N:
+        raise Exception(f"k={k} is not between 0 and {N} nodes!")
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if tile_size is None:
+        tile_elements = graco.distance_matrices.TILE_ELEMENTS
+        tile_size = math.isqrt(tile_elements // max(X.shape[1], 1))
+    rows = max(1, tile_size)
+
+    indices   = np.full((N,k), -1)
+    distances = np.full((N,k), np.inf)
+
+    def tile(start):
+        stop = min(start+rows, N)
+        best_D, best_I = distances[start:stop], indices[start:stop]
+        for column in range(0, N, rows):
+            columns = np.arange(column, min(column+rows, N))
+            D = kernel(X[start:stop], X[columns])
+            D[np.isnan(D)] = np.inf
+            D[np.arange(start, stop)[:,None] == columns[None]] = np.inf
+            best_D, best_I = _merge(best_D, best_I, D,
+                                    np.broadcast_to(columns, D.shape), k)
+
+        order = np.lexsort((best_I, best_D), axis=1)
+        best_D = np.take_along_axis(best_D, order, axis=1)
+        best_I = np.take_along_axis(best_I, order, axis=1)
+        best_I[np.isinf(best_D)] = -1
+        distances[start:stop] = best_D
+        indices[start:stop]   = best_I
+
+    with ThreadPoolExecutor(n_jobs) as pool:
+        list(pool.map(tile, range(0, N, rows)))
+    return indices, distances
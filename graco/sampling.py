@@ -0,0 +1,102 @@
+"""
+Approximate orbit counts for graphs that are too large to count exactly.
+
+Every replicate keeps each edge independently with probability p and counts
+the non-induced orbits on the sparsified graph. A non-induced copy of a
+graphlet with m edges survives with probability p**m, so dividing by p**m
+gives an unbiased estimate, which counting.induced_counts turns into
+unbiased estimates of the induced counts. Orbits whose non-induced counts
+only depend on degrees are computed exactly. The spread of the replicates
+gives per-entry confidence intervals.
+"""
+
+from graco import counting
+
+import scipy.sparse
+import scipy.stats
+import numpy as np
+import time
+
+# number of edges of the graphlet of every orbit
+ORBIT_EDGES = np.array([1,2,2,3,3,3,3,3,4,4,4,4,5,5,6])
+
+# orbits whose non-induced counts are computed exactly from the degrees
+EXACT_ORBITS = [0,1,2,6,7]
+
+# Expected number of wedges of a sparsified graph, used to choose p.
+SAMPLE_WEDGES = 2**24
+
+
+def _sparsify(A, p, rng):
+    U = scipy.sparse.triu(A, k=1, format='coo')
+    keep = rng.random_sample(U.nnz) < p
+    return scipy.sparse.coo_matrix((np.ones(keep.sum(), dtype=np.int64),
+                                    (U.row[keep], U.col[keep])),
+                                   shape=A.shape)
+
+def sample_rate(A):
+    """
+    Edge sampling rate for which a sparsified graph has about SAMPLE_WEDGES
+    wedges.
+    """
+    d = np.diff(A.indptr)
+    wedges = counting._binom2(d).sum()
+    return min(1., np.sqrt(SAMPLE_WEDGES / max(wedges,1)))
+
+
+def sampled_orbit_counts(A, rel_error=0.05, time_budget=None, p=None,
+                            confidence=0.95, seed=None, n_jobs=1,
+                            max_replicates=100):
+    """
+    Estimates the 15 orbit counts of every node and returns the estimates
+    and the half-widths of their confidence intervals as (N,15) float arrays.
+
+    Replicates are drawn until, for every orbit, the half-widths of all
+    nodes sum up to at most rel_error times the sum of their estimates. The
+    criterion is per orbit, not per entry: single nodes may have wider
+    intervals, which the returned half-widths show. Sampling stops early
+    after max_replicates replicates or time_budget seconds (at least two
+    replicates are drawn). Negative estimates are set to zero. With p=1,
+    e.g. for small graphs, the exact counts are returned.
+    """
+    start = time.time()
+    A = counting.to_csr(A)
+    if p is None:
+        p = sample_rate(A)
+    if p >= 1:
+        GDV = counting.orbit_counts(A, n_jobs=n_jobs).astype(float)
+        return GDV, np.zeros_like(GDV)
+
+    rng = np.random.RandomState(seed)
+    d  = np.diff(A.indptr).astype(np.int64)
+    n1 = A @ (d-1)
+    exact = np.column_stack([d, n1, counting._binom2(d),
+                             A @ counting._binom2(d-1), counting._binom3(d)])
+
+    # running mean and sum of squared deviations (Welford)
+    n, GDV, M2 = 0, 0., 0.
+    while True:
+        non_induced = counting.non_induced_counts(_sparsify(A, p, rng),
+                                                  n_jobs=n_jobs)
+        non_induced = non_induced / p**ORBIT_EDGES
+        non_induced[:,EXACT_ORBITS] = exact
+        sample = counting.induced_counts(non_induced)
+
+        n += 1
+        delta = sample - GDV
+        GDV = GDV + delta/n
+        M2  = M2 + delta*(sample - GDV)
+        if n < 2:
+            continue
+
+        z = scipy.stats.t.ppf((1+confidence)/2, df=n-1)
+        half_width = z * np.sqrt(M2/(n-1)/n)
+
+        if (half_width.sum(axis=0) <= rel_error*np.abs(GDV).sum(axis=0)).all():
+            break
+        if n >= max_replicates:
+            break
+        if time_budget is not None and time.time()-start >= time_budget:
+            break
+
+    return np.maximum(GDV, 0), half_width
@@ -1,6 +1,12 @@
 import os
+import sys
 import graco
+import graco.functions
+import graco.graphlets
 import unittest
+from unittest import mock
+import subprocess
+import scipy.sparse
 import numpy as np
 import pandas as pd
 import networkx as nx
@@ -23,6 +29,174 @@ class TestOrca(unittest.TestCase):
         pd.testing.assert_frame_equal(GDV1.sort_index(axis=0),
                                       GDV2.sort_index(axis=0))
 
+    def test_missing_binary(self):
+        edges = np.array([[0,1], [1,2]])
+        fds = len(os.listdir('/dev/fd'))
+        with mock.patch.object(graco.functions, 'ORCA_PATH', '/nonexistent'):
+            with self.assertRaises(OSError):
+                graco.functions.run_orca(edges, 3)
+        self.assertEqual(len(os.listdir('/dev/fd')), fds)
+
+    def test_backends(self):
+        for G in [nx.erdos_renyi_graph(2**7, 0.1),
+                  nx.powerlaw_cluster_graph(2**8, 4, 0.5)]:
+            GDV1 = graco.orbits(G, backend='graco')
+            GDV2 = graco.orbits(G, backend='orca')
+            pd.testing.assert_frame_equal(GDV1, GDV2)
+
+    def test_large_node_indices(self):
+        G = nx.powerlaw_cluster_graph(2**16, 3, 0.5)
+        GDV1 = graco.orbits(G, backend='graco')
+        GDV2 = graco.orbits(G, backend='orca')
+        pd.testing.assert_frame_equal(GDV1, GDV2)
+
+    def test_parallel(self):
+        G = nx.powerlaw_cluster_graph(2**9, 4, 0.5)
+        GDV1 = graco.orbits(G)
+        GDV2 = graco.orbits(G, n_jobs=3)
+        pd.testing.assert_frame_equal(GDV1, GDV2)
+
+    def test_concurrent_orca(self):
+        from multiprocessing.pool import ThreadPool
+        G = nx.read_edgelist(f"{DATA_PATH}/golden_edgelist.txt", nodetype=int)
+        edges = graco.functions._edge_array(G)
+        with ThreadPool(4) as p:
+            GDVs = p.starmap(graco.functions.run_orca, [(edges, len(G))]*8)
+        for GDV in GDVs:
+            np.testing.assert_array_equal(GDV, GDVs[0])
+
+    def test_plain_script(self):
+        # runs outside of pytest's warning filters, like a user's script
+        script = ("import graco, networkx as nx; G = nx.path_graph(9); "
+                  "graco.orbits(G); graco.coefficients(G); graco.DynamicGDV(G)")
+        process = subprocess.run([sys.executable, '-c', script],
+                            env = {**os.environ,
+                                   'PYTHONPATH':os.path.dirname(GRACO_PATH)},
+                            stderr = subprocess.PIPE)
+        self.assertEqual(process.returncode, 0, process.stderr.decode())
+
+    def test_input_types(self):
+        G = nx.powerlaw_cluster_graph(2**7, 3, 0.5)
+        G = nx.relabel_nodes(G, {node:f"n{node}" for node in G})
+        G.add_edge('n0', 'n0')
+        labels = list(G)
+        index = {node:n for n,node in enumerate(labels)}
+        edges = np.array([[index[u], index[v]] for u,v in G.edges()])
+        A = scipy.sparse.csr_matrix(nx.to_scipy_sparse_array(G))
+
+        GDV = graco.orbits(G)
+        self.assertEqual(nx.number_of_selfloops(G), 1)
+        pd.testing.assert_frame_equal(graco.orbits(A, labels=labels), GDV)
+        pd.testing.assert_frame_equal(graco.orbits(edges, labels=labels), GDV)
+        pd.testing.assert_frame_equal(graco.orbits(edges, backend='orca',
+                                                   labels=labels), GDV)
+        pd.testing.assert_frame_equal(graco.coefficients(edges, labels=labels),
+                                      graco.coefficients(G))
+        np.testing.assert_array_equal(graco.triangle_signature(edges),
+                                      graco.triangle_signature(G))
+
+    def test_node_subset(self):
+        G = nx.powerlaw_cluster_graph(2**10, 4, 0.5)
+        nodes = list(np.random.choice(2**10, size=20, replace=False))
+        G.add_edge(nodes[0], nodes[0])
+        GDV = graco.orbits(G)
+        pd.testing.assert_frame_equal(graco.orbits(G, nodes=nodes),
+                                      GDV.loc[nodes])
+        pd.testing.assert_frame_equal(graco.orbits(G, nodes=nodes,
+                                                   backend='orca'),
+                                      GDV.loc[nodes])
+        pd.testing.assert_frame_equal(graco.coefficients(G, nodes=nodes),
+                                      graco.coefficients(GDV).loc[nodes])
+
+    def test_five_node_orbits(self):
+        G = nx.powerlaw_cluster_graph(2**8, 3, 0.5)
+        GDV4 = graco.orbits(G)
+        GDV5 = graco.orbits(G, graphlet_nodes=5)
+        self.assertEqual(GDV5.shape, (2**8, 73))
+        pd.testing.assert_frame_equal(GDV5.iloc[:,:15], GDV4)
+
+class TestMany(unittest.TestCase):
+    def setUp(self):
+        self.graphs = {'ER' : nx.erdos_renyi_graph(2**7, 0.05),
+                       'BA' : nx.barabasi_albert_graph(2**8, 3),
+                       'PC' : nx.powerlaw_cluster_graph(2**6, 3, 0.5)}
+
+    def test_orbits_many(self):
+        GDVs, seconds = graco.orbits_many(self.graphs, n_jobs=2)
+        self.assertEqual(list(GDVs), list(self.graphs))
+        self.assertEqual(list(seconds), list(self.graphs))
+        for name, G in self.graphs.items():
+            pd.testing.assert_frame_equal(GDVs[name], graco.orbits(G))
+
+    def test_coefficients_stream(self):
+        graphs = list(self.graphs.values())
+        results = graco.coefficients_many(graphs, n_jobs=1, stream=True)
+        keys = []
+        for key, GCV, seconds in results:
+            pd.testing.assert_frame_equal(GCV, graco.coefficients(graphs[key]))
+            keys.append(key)
+        self.assertEqual(keys, [1, 0, 2])
+
+class TestSampledOrbits(unittest.TestCase):
+    def setUp(self):
+        self.G = nx.powerlaw_cluster_graph(2**9, 6, 0.5)
+        self.GDV = graco.orbits(self.G)
+
+    def test_exact_rate(self):
+        GDV, half_width = graco.sampled_orbits(self.G, sample_rate=1)
+        pd.testing.assert_frame_equal(GDV, self.GDV.astype(float))
+        self.assertEqual(half_width.values.sum(), 0)
+
+    def test_estimates(self):
+        GDV, half_width = graco.sampled_orbits(self.G, rel_error=0.2,
+                                               sample_rate=0.8, seed=0)
+        self.assertEqual(GDV.shape, self.GDV.shape)
+        np.testing.assert_array_equal(GDV['0'], self.GDV['0'])
+        assert (half_width.sum() <= 0.2*GDV.sum()).all()
+        covered = (GDV - self.GDV).abs() <= half_width + 1e-6
+        assert covered.values.mean() > 0.8
+        GCV = graco.coefficients(GDV)
+        self.assertEqual(GCV.shape, graco.coefficients(self.GDV).shape)
+
+    def test_max_replicates(self):
+        A = graco.functions.to_adjacency(self.G)[0]
+        with mock.patch.object(graco.counting, 'non_induced_counts',
+                    wraps=graco.counting.non_induced_counts) as counts:
+            GDV, half_width = graco.sampling.sampled_orbit_counts(A,
+                                        rel_error=0, p=0.5, seed=0,
+                                        max_replicates=3)
+        self.assertEqual(counts.call_count, 3)
+        assert (half_width.sum(axis=0) > 0).any()
+
+class TestDynamicGDV(unittest.TestCase):
+    def setUp(self):
+        self.G = nx.powerlaw_cluster_graph(2**7, 3, 0.5)
+        self.GDV = graco.DynamicGDV(self.G.copy(), GDV=graco.orbits(self.G))
+
+    def assert_up_to_date(self):
+        GDV = graco.orbits(self.G.copy())
+        pd.testing.assert_frame_equal(self.GDV.GDV.loc[GDV.index], GDV)
+        GCV = graco.coefficients(GDV)
+        pd.testing.assert_frame_equal(
+                        graco.coefficients(self.GDV).loc[GCV.index], GCV)
+        np.testing.assert_array_equal(
+                        graco.coefficients(self.GDV, dtype=np.ndarray),
+                        graco.coefficients(self.GDV).values)
+
+    def test_edge_updates(self):
+        rng = np.random.RandomState(0)
+        for _ in range(50):
+            u, v = rng.choice(2**7 + 4, size=2, replace=False)
+            self.G.add_edge(u, v)
+            self.GDV.add_edge(u, v)
+        self.assert_up_to_date()
+
+        for _ in range(50):
+            u, v = list(self.G.edges())[rng.randint(self.G.number_of_edges())]
+            self.G.remove_edge(u, v)
+            self.GDV.remove_edge(u, v)
+        self.assert_up_to_date()
+
 class TestGCV(unittest.TestCase):
     def setUp(self):
         self.G   = nx.erdos_renyi_graph(2**9,0.05)
@@ -32,6 +206,81 @@ class TestGCV(unittest.TestCase):
         for eq in set(zip(*map(self.GCV.columns.get_level_values, [0,1]))):
             assert np.isclose(self.GCV[eq].dropna().sum(axis=1), 1).all()
 
+    def test_generated_equations(self):
+        GDV = graco.orbits(self.G)
+        GCV = graco.graphlets.coefficients(GDV, graco.graphlets._weights(4))
+        GCV = GCV.loc[:, ['D','A','G']]
+        pd.testing.assert_frame_equal(GCV, self.GCV.loc[:, GCV.columns],
+                                      check_names=False)
+
+    def test_five_node_convexity(self):
+        G = nx.powerlaw_cluster_graph(2**8, 3, 0.5)
+        GCV = graco.coefficients(G, graphlet_nodes=5)
+        GDV = graco.orbits(G, graphlet_nodes=5)
+        for group, equation, terms in graco.graphlets.EQUATIONS5:
+            if group != 'D':
+                continue
+            free = GDV['0'] - graco.graphlets.degree_in_graphlet(int(equation))
+            np.testing.assert_array_equal(
+                sum(weight*GDV[str(orbit)] for orbit,weight in terms.items()),
+                GDV[equation] * free)
+        for eq in set(zip(*map(GCV.columns.get_level_values, [0,1]))):
+            assert np.isclose(GCV[eq].dropna().sum(axis=1), 1).all()
+
+    def test_array_container(self):
+        GCV = graco.coefficients(self.G, dtype=graco.GCVArray)
+        pd.testing.assert_frame_equal(GCV.to_frame(), self.GCV)
+        np.testing.assert_array_equal(
+                    graco.coefficients(self.G, dtype=np.ndarray),
+                    self.GCV.values)
+
+        assert np.shares_memory(GCV.group('D'), GCV.values)
+        np.testing.assert_array_equal(GCV.equation('G','1-1'),
+                                      self.GCV[('G','1-1')].values)
+        pd.testing.assert_frame_equal(
+                GCV.select(['D','G'], drop=[('G','2-1')]).to_frame(),
+                self.GCV[['D','G']].drop(('G','2-1'), axis=1))
+
+        for (eq1, coeffs1), (eq2, coeffs2) in zip(
+                        graco.iter_equation_coefficients(self.GCV),
+                        self.GCV.groupby(level=[0,1], axis=1)):
+            assert eq1 == eq2
+            pd.testing.assert_frame_equal(coeffs1, coeffs2)
+
+
+class TestFeatures(unittest.TestCase):
+    def setUp(self):
+        self.G   = nx.powerlaw_cluster_graph(2**9, 3, 0.5)
+        self.GCV = graco.coefficients(self.G)
+
+    def test_three_node_orbits(self):
+        A, _ = graco.functions.to_adjacency(self.G)
+        np.testing.assert_array_equal(
+                        graco.counting.three_node_orbit_counts(A),
+                        graco.counting.orbit_counts(A)[:,:4])
+
+    def test_triangle_signature(self):
+        A, _ = graco.functions.to_adjacency(self.G)
+        np.testing.assert_array_equal(graco.counting.triangle_counts(A),
+                                      graco.counting.triangle_counts(A, 2))
+        C_D, C_A = graco.triangle_signature(self.G)
+        np.testing.assert_allclose(C_D, list(nx.clustering(self.G).values()))
+
+    def test_feature_sets(self):
+        for name in graco.feature_sets.FEATURES:
+            features = graco.features(self.G, name)
+            pd.testing.assert_frame_equal(features,
+                                          self.GCV.loc[:, features.columns])
+            equations = set(zip(*map(features.columns.get_level_values,
+                                     [0,1])))
+            assert equations == {(group, equation) for group, equation, _ in
+                                    graco.feature_sets.equations(name)}
+
+        features = graco.features(self.G, 'GCV-DG-2')
+        pd.testing.assert_frame_equal(features,
+                    self.GCV[['D','G']].drop(('G','2-1'), axis=1))
+        assert graco.feature_sets.orbits('GCV-3') == [1, 2, 3]
+
 
 if __name__ == '__main__':
     unittest.main()
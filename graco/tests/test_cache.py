@@ -0,0 +1,53 @@
+import graco
+import graco.cache
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+# ============================================================================
+#                                   Cache
+# ============================================================================
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = graco.cache.enable(self.directory.name)
+        self.G = nx.powerlaw_cluster_graph(2**7, 3, 0.5)
+
+    def tearDown(self):
+        graco.cache.disable()
+        self.directory.cleanup()
+
+    def test_hits_and_misses(self):
+        GDV1 = graco.orbits(self.G)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        GDV2 = graco.orbits(self.G)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        pd.testing.assert_frame_equal(GDV1, GDV2)
+
+    def test_node_order(self):
+        GDV1 = graco.orbits(self.G)
+        H = nx.Graph()
+        H.add_nodes_from(reversed(list(self.G)))
+        H.add_edges_from((v,u) for u,v in self.G.edges())
+        GDV2 = graco.orbits(H)
+        self.assertEqual(self.cache.hits, 1)
+        pd.testing.assert_frame_equal(GDV1, GDV2.loc[GDV1.index])
+
+    def test_coefficients(self):
+        GCV1 = graco.coefficients(self.G)
+        GCV2 = graco.coefficients(self.G)
+        self.assertEqual(self.cache.hits, 1)
+        pd.testing.assert_frame_equal(GCV1, GCV2)
+
+    def test_eviction(self):
+        self.cache.max_size = 0
+        graco.orbits(self.G)
+        graco.orbits(self.G)
+        self.assertEqual(self.cache.hits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
 from scipy.spatial.distance import squareform, pdist
 from itertools import combinations
 from functools import partial
+from unittest import mock
 
 import graco
+import tempfile
 import unittest
 import numpy as np
 import networkx as nx
@@ -26,6 +28,13 @@ class TestIntCompabilities(unittest.TestCase):
         np.testing.assert_almost_equal(D1, D3, decimal=4)
         np.testing.assert_almost_equal(D2, D3, decimal=4)
 
+    def test_int_GDV_similarity_five_nodes(self):
+        GDV = np.random.randint(2**59, size=[50,73])
+        D1 = graco.distance_matrices.GDV_similarity(GDV)
+        D2 = squareform([graco.distances.GDV_similarity(u,v)
+                        for u,v in combinations(GDV,2)])
+        np.testing.assert_almost_equal(D1, D2, decimal=4)
+
     def test_int_hellinger(self):
         D1 = graco.distance_matrices.hellinger(self.GDV)
         D2 = graco.distance_matrix(self.GDV, 'hellinger')
@@ -46,6 +55,118 @@ class TestIntCompabilities(unittest.TestCase):
         np.testing.assert_almost_equal(D1, D3, decimal=4)
         np.testing.assert_almost_equal(D2, D3, decimal=4)
 
+    @unittest.skipUnless(graco.distance_matrices.cpp_available(),
+                         "C++ tools not built, see graco/cpp/Makefile")
+    def test_backends(self):
+        for distance in ['GDV_similarity', 'hellinger', 'js_divergence']:
+            function = getattr(graco.distance_matrices, distance)
+            D1 = function(self.GDV, tile_size=7)
+            D2 = function(self.GDV, backend='cpp')
+            np.testing.assert_almost_equal(D1, D2, decimal=10)
+            np.testing.assert_array_equal(D1, D1.T)
+
+    @unittest.skipUnless(graco.distance_matrices.cpp_available(),
+                         "C++ tools not built, see graco/cpp/Makefile")
+    def test_cpp_output_file(self):
+        with tempfile.TemporaryDirectory() as path:
+            D = graco.distance_matrices.hellinger(self.GDV, backend = 'cpp',
+                                                  out = f"{path}/D.mat")
+            assert type(D) == np.memmap
+            np.testing.assert_almost_equal(D,
+                                    graco.distance_matrices.hellinger(self.GDV))
+            del D
+
+    def test_condensed(self):
+        for distance in ['GDV_similarity', 'hellinger', 'js_divergence',
+                         'euclidean']:
+            D1 = graco.distance_matrix(self.GDV, distance)
+            D2 = graco.distance_matrix(self.GDV, distance,
+                                       condensed = True,
+                                       dtype     = np.float32,
+                                       tile_size = 7)
+            assert D2.dtype == np.float32
+            assert D2.values.shape == (len(self.GDV)*(len(self.GDV)-1)//2,)
+            np.testing.assert_allclose(D2.to_numpy(), D1, rtol=1e-5)
+            np.testing.assert_allclose(D2[3,7], D1[3,7], rtol=1e-5)
+            np.testing.assert_allclose(D2[7,3], D1[3,7], rtol=1e-5)
+            self.assertEqual(D2[5,5], 0)
+
+    def test_out_of_core(self):
+        with tempfile.TemporaryDirectory() as path:
+            for condensed in [False, True]:
+                for distance in ['hellinger', 'canberra']:
+                    out = f"{path}/{distance}{condensed}.mat"
+                    D1 = graco.distance_matrix(self.GDV, distance,
+                                               condensed=condensed)
+                    D2 = graco.distance_matrix(self.GDV, distance,
+                                               condensed=condensed, out=out,
+                                               tile_size=7)
+                    np.testing.assert_allclose(np.asarray(D2.values if
+                                               condensed else D2),
+                                               D1.values if condensed
+                                               else D1)
+
+                    # interrupted after two tiles, with a partial line
+                    with open(f"{out}.tiles") as f:
+                        lines = f.readlines()
+                    with open(f"{out}.tiles", 'w') as f:
+                        f.writelines(lines[:3] + ['49'])
+                    stop = int(lines[2].split()[1])
+                    D = graco.distance_matrices.open_matrix(out,
+                                D1.values.shape if condensed else D1.shape)
+                    if condensed:
+                        N = len(self.GDV)
+                        D[stop*(2*N-stop-1)//2:] = 0
+                    else:
+                        D[stop:, stop:] = 0
+                    D.flush()
+                    del D, D2
+
+                    D3 = graco.distance_matrix(self.GDV, distance,
+                                               condensed=condensed, out=out,
+                                               tile_size=7)
+                    with open(f"{out}.tiles") as f:
+                        assert f.read().startswith(''.join(lines[:3]))
+                    np.testing.assert_allclose(np.asarray(D3.values if
+                                               condensed else D3),
+                                               D1.values if condensed
+                                               else D1)
+                    del D3
+
+    def test_resume_other_input(self):
+        with tempfile.TemporaryDirectory() as path:
+            out = f"{path}/hellinger.mat"
+            graco.distance_matrix(self.GDV, 'hellinger', out=out)
+            with self.assertRaises(Exception):
+                graco.distance_matrix(self.GDV, 'js_divergence', out=out)
+            GDV = self.GDV.copy()
+            GDV[0,0] //= 2
+            with self.assertRaises(Exception):
+                graco.distance_matrix(GDV, 'hellinger', out=out)
+            with self.assertRaises(Exception):
+                graco.distance_matrix(self.GDV, 'hellinger', out=out,
+                                      condensed=True)
+            D = graco.distance_matrix(self.GDV, 'hellinger', out=out)
+            np.testing.assert_allclose(D, graco.distance_matrix(self.GDV,
+                                                                'hellinger'))
+
+    def test_tile_size(self):
+        N = len(self.GDV)
+        D1 = graco.distance_matrix(self.GDV, 'hellinger')
+        with tempfile.TemporaryDirectory() as path:
+            for flush_bytes in [0, 2**28]:
+                out = f"{path}/hellinger{flush_bytes}.mat"
+                with mock.patch.object(graco.distance_matrices,
+                                       'FLUSH_BYTES', flush_bytes):
+                    D2 = graco.distance_matrix(self.GDV, 'hellinger',
+                                               out=out, tile_size=7)
+                np.testing.assert_allclose(D2, D1)
+                with open(f"{out}.tiles") as f:
+                    assert sorted(f.read().splitlines()[1:]) == \
+                           sorted(f"{start} {min(start+7, N)}"
+                                  for start in range(0, N, 7))
+                del D2
+
     def test_int_pdist(self):
         for distance in ['euclidean', 'cityblock', 'sqeuclidean',
                          'cosine', 'correlation', 'chebyshev',
@@ -101,6 +222,51 @@ class TestGCVDistance(unittest.TestCase):
                         for (_,u),(_,v) in combinations(self.GCV.iterrows(), 2)])
             np.testing.assert_almost_equal(D1, D2, decimal=4)
 
+    def test_condensed(self):
+        self.GCV.iloc[2] = np.nan
+        D1 = graco.GCV_distance_matrix(self.GCV, 'hellinger')
+        D2 = graco.GCV_distance_matrix(self.GCV, 'hellinger',
+                                       condensed = True,
+                                       dtype     = np.float32)
+        np.testing.assert_array_equal(D2.labels, self.GCV.index)
+        np.testing.assert_allclose(D2.to_frame().values[D1.notna()],
+                                   D1.values[D1.notna()], rtol=1e-5)
+        assert D1.iloc[2].isna().all()
+        assert np.isnan(D2[2,5])
+
+    def test_tiles(self):
+        GCV = graco.GCVArray.from_frame(self.GCV)
+        D1 = graco.GCV_distance_matrix(self.GCV, 'euclidean')
+        D2 = graco.GCV_distance_matrix(GCV, 'euclidean', n_jobs=2, tile_size=3)
+        D3 = squareform([graco.GCV_distance(u, v, 'euclidean')
+                    for (_,u),(_,v) in combinations(self.GCV.iterrows(), 2)])
+        np.testing.assert_array_equal(D1, D2)
+        np.testing.assert_almost_equal(D1, D3)
+
+class TestKNN(unittest.TestCase):
+    def setUp(self):
+        G = nx.powerlaw_cluster_graph(60, 2, 0.3)
+        self.GDV = graco.orbits(G)
+        self.GCV = graco.coefficients(G)
+
+    def test_knn(self):
+        for features, metric, D in [
+                (self.GDV, 'GDV_similarity',
+                 graco.distance_matrix(self.GDV.values, 'GDV_similarity')),
+                (self.GDV, 'canberra',
+                 graco.distance_matrix(self.GDV.values, 'canberra')),
+                (self.GCV, 'hellinger',
+                 graco.GCV_distance_matrix(self.GCV, 'hellinger').values)]:
+            indices, distances = graco.knn(features, metric, k=5,
+                                           tile_size=7)
+            D = np.where(np.isnan(D), np.inf, D)
+            np.fill_diagonal(D, np.inf)
+            assert (indices != np.arange(len(D))[:,None]).all()
+            np.testing.assert_almost_equal(distances,
+                                           np.sort(D, axis=1)[:,:5])
+            np.testing.assert_almost_equal(distances,
+                    np.take_along_axis(D, indices, axis=1))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,11 @@
-from scipy.spatial.distance import pdist
+from scipy.spatial.distance import pdist, squareform
+from itertools import combinations
 
 import graco
+import tempfile
 import unittest
 import numpy as np
+import networkx as nx
 
 
 # ============================================================================
@@ -36,7 +39,7 @@ class TestIntCompabilities(unittest.TestCase):
     def test_int_pdist(self):
         for distance in all_distances:
             d2 = graco.distance(self.u,self.v, distance)
-            d1 = float(pdist([self.u,self.v], distance))
+            d1 = float(pdist([self.u,self.v], distance)[0])
             np.testing.assert_almost_equal(d1, d2, decimal=4)
 
 
@@ -59,10 +62,126 @@ class TestFloatCompabilities(unittest.TestCase):
     def test_float_pdist(self):
         for distance in all_distances:
             d2 = graco.core.distance(self.u,self.v, distance)
-            d1 = float(pdist([self.u,self.v], distance))
+            d1 = float(pdist([self.u,self.v], distance)[0])
             np.testing.assert_almost_equal(d1, d2, decimal=4)
 
 
+class TestEMD(unittest.TestCase):
+    def setUp(self):
+        self.xs = np.random.uniform(size=[60,2])
+        self.xt = np.random.uniform(size=[80,2])**2
+
+    def test_1d_emd(self):
+        a = np.ones(60)/60
+        b = np.ones(80)/80
+        for metric in ['euclidean', 'sqeuclidean']:
+            d1 = graco.core._emd_dense(self.xs[:,:1], self.xt[:,:1], a, b,
+                                       metric, 2**17)
+            d2 = graco.emd(self.xs[:,0], self.xt[:,0], metric)
+            np.testing.assert_almost_equal(d1, d2)
+
+    def test_approximate_emd(self):
+        rng = np.random.RandomState(0)
+        xs = rng.uniform(size=[600,2])
+        xt = rng.uniform(size=[800,2])**2
+        d = graco.emd(xs, xt)
+        low  = np.minimum(xs.min(axis=0), xt.min(axis=0))
+        high = np.maximum(xs.max(axis=0), xt.max(axis=0))
+        for bins in [8, 16]:
+            centers, weights = graco.core._histogram(xs, low, high, bins)
+            assert len(centers) <= bins**2 < len(xs)
+            np.testing.assert_almost_equal(weights.sum(), 1)
+            np.testing.assert_almost_equal(weights @ centers, xs.mean(axis=0))
+
+            # every point moves by at most the diagonal of its cell, the
+            # moves to the cell means mostly cancel (about diagonal/25)
+            diagonal = np.linalg.norm((high-low)/bins)
+            d_binned = graco.emd(xs, xt, method='binned', bins=bins)
+            assert d_binned != d
+            assert abs(d_binned - d) <= diagonal/10
+        assert 0 < graco.emd(xs, xt, method='sliced') <= d
+
+    def test_sinkhorn(self):
+        xts = [self.xt, self.xt[:50]]
+        costs, log = graco.sinkhorn(self.xs, xts, reg=3e-3, max_iter=5000)
+        assert log['converged'].all()
+        for cost, xt in zip(costs, xts):
+            d = graco.emd(self.xs, xt)
+            np.testing.assert_allclose(cost, d, rtol=0.05, atol=1e-2)
+            np.testing.assert_almost_equal(cost, graco.emd(self.xs, xt,
+                                    method='sinkhorn', reg=3e-3, max_iter=5000),
+                                    decimal=4)
+        with self.assertRaises(ValueError):
+            graco.sinkhorn(self.xs, self.xt, max_iter=0)
+        with self.assertWarns(graco.transport.ConvergenceWarning):
+            graco.emd(self.xs, self.xt, method='sinkhorn', reg=1e-3,
+                                                          max_iter=10)
+
+
+class TestNetworkDistances(unittest.TestCase):
+    def setUp(self):
+        self.graphs = [nx.powerlaw_cluster_graph(2**7, 3, p)
+                                        for p in np.linspace(0, 0.9, 4)]
+
+    def test_network_distance_matrix(self):
+        for method, function in [('triangle', graco.triangle_distance),
+                                 ('GCD11',    graco.GCD11)]:
+            D = [function(G1, G2) for G1, G2 in combinations(self.graphs, 2)]
+            for n_jobs in [1, 2]:
+                np.testing.assert_almost_equal(
+                    graco.network_distance_matrix(self.graphs, method,
+                                                  n_jobs=n_jobs), D)
+
+    def test_emd_method(self):
+        D = [graco.triangle_distance(G1, G2, method='sliced', seed=0)
+                                for G1, G2 in combinations(self.graphs, 2)]
+        for n_jobs in [1, 2]:
+            np.testing.assert_almost_equal(
+                graco.network_distance_matrix(self.graphs, 'triangle',
+                                              emd_method='sliced', seed=0,
+                                              n_jobs=n_jobs), D)
+        with self.assertRaises(Exception):
+            graco.network_distance_matrix(self.graphs, emd_method='unknown')
+
+    def test_sinkhorn_batches(self):
+        D = [graco.triangle_distance(G1, G2, method='sinkhorn', reg=1e-2)
+                                for G1, G2 in combinations(self.graphs, 2)]
+        for n_jobs in [1, 2]:
+            np.testing.assert_allclose(
+                graco.network_distance_matrix(self.graphs, 'triangle',
+                                              emd_method='sinkhorn', reg=1e-2,
+                                              n_jobs=n_jobs), D, rtol=1e-4)
+        with self.assertWarns(graco.transport.ConvergenceWarning):
+            graco.network_distance_matrix(self.graphs, emd_method='sinkhorn',
+                                          reg=1e-3, max_iter=10)
+
+    def test_GDDA(self):
+        G = self.graphs[0]
+        assert graco.GDDA(G, G) == 1
+        GDD = graco.GDD(graco.orbits(G))
+        np.testing.assert_almost_equal(GDD.groupby(level=0).sum().values, 1)
+        D = [1 - graco.GDDA(G1, G2) for G1, G2 in combinations(self.graphs, 2)]
+        np.testing.assert_almost_equal(
+                    graco.network_distance_matrix(self.graphs, 'GDDA'), D)
+
+    def test_GCM_store(self):
+        store = graco.gcm.GCMStore(orbits=11)
+        store.add_many(dict(enumerate(self.graphs)), n_jobs=1)
+        np.testing.assert_almost_equal(store.query(self.graphs[0]),
+                        [graco.GCD11(self.graphs[0], G) for G in self.graphs])
+
+        with tempfile.TemporaryDirectory() as path:
+            store.save(f"{path}/GCMs.npz")
+            loaded = graco.gcm.GCMStore.load(f"{path}/GCMs.npz")
+        np.testing.assert_array_equal(loaded.GCMs, store.GCMs)
+
+        GDV = graco.orbits(self.graphs[1])
+        GDV.loc['NULL'] = 1
+        np.testing.assert_almost_equal(
+                    graco.gcm.GCM(GDV.iloc[:-1], 15, 'spearman'),
+                    squareform(GDV.corr('spearman'), checks=False))
+
+
 class TestGCVDistance(unittest.TestCase):
     def setUp(self):
         self.GDV = np.array([
@@ -27,7 +27,7 @@ class TestNormalizations(unittest.TestCase):
         GCV.index = range(len(gcv1)+len(gcv2))
 
         for distance in distances:
-            max_value = np.max(np.max(graco.GCV_distance_matrix(GCV, distance)))
+            max_value = graco.GCV_distance_matrix(GCV, distance).max().max()
             assert np.isclose(max_value, 1)
 
     def test_length3_convex_combinations(self):
@@ -42,7 +42,7 @@ class TestNormalizations(unittest.TestCase):
         GCV.index = range(len(gcv1)+len(gcv2))
 
         for distance in distances:
-            max_value = np.max(np.max(graco.GCV_distance_matrix(GCV, distance)))
+            max_value = graco.GCV_distance_matrix(GCV, distance).max().max()
             assert np.isclose(max_value, 1)
 
     def test_length4_convex_combinations(self):
@@ -58,7 +58,7 @@ class TestNormalizations(unittest.TestCase):
         GCV.index = range(len(gcv1)+len(gcv2))
 
         for distance in distances:
-            max_value = np.max(np.max(graco.GCV_distance_matrix(GCV, distance)))
+            max_value = graco.GCV_distance_matrix(GCV, distance).max().max()
             assert np.isclose(max_value, 1)
 
     def test_length5_convex_combinations(self):
@@ -73,7 +73,7 @@ class TestNormalizations(unittest.TestCase):
         GCV.index = range(len(gcv1)+len(gcv2))
 
         for distance in distances:
-            max_value = np.max(np.max(graco.GCV_distance_matrix(GCV, distance)))
+            max_value = graco.GCV_distance_matrix(GCV, distance).max().max()
             assert np.isclose(max_value, 1)
 
 if __name__ == '__main__':
@@ -0,0 +1,116 @@
+"""
+Entropic optimal transport (Sinkhorn) between uniform point sets.
+
+The iterations run on the dual potentials in the log domain, so that small
+regularisations do not underflow. Several target sets can be solved against
+the same reference set in one call: they are padded to a common size with
+zero-weight points and iterated together as a (targets, N, M) array.
+
+    cost, log = graco.sinkhorn(xs, [xt1, xt2, xt3], reg=0.01)
+    log['converged']    # array([ True,  True,  True])
+
+graco.emd and graco.network_distance_matrix, which only return the cost,
+raise a ConvergenceWarning for problems that did not converge.
+"""
+
+from scipy.spatial.distance import cdist
+from scipy.special import logsumexp
+
+import numpy as np
+import warnings
+
+# iterations between two checks of the marginal errors
+CHECK_EVERY = 10
+
+class ConvergenceWarning(RuntimeWarning):
+    """
+    Sinkhorn stopped at max_iter before the marginal error was below tol.
+    """
+
+def _warn_unconverged(log):
+    """
+    Warns if not every problem of a sinkhorn log converged.
+    """
+    converged = np.atleast_1d(log['converged'])
+    if not converged.all():
+        error = np.atleast_1d(log['error'])[~converged].max()
+        warnings.warn(f"Sinkhorn did not converge for {(~converged).sum()} "
+                      f"of {len(converged)} problems after "
+                      f"{np.max(log['iterations'])} iterations (marginal "
+                      f"error {error:.2e}), increase max_iter or reg!",
+                      ConvergenceWarning, stacklevel=3)
+
+def _padded_costs(xs, xts, metric):
+    """
+    Distances of xs to every target set as a (targets, N, M) array padded
+    with zeros, and the log weights of the targets, -inf for padding.
+    """
+    M = np.zeros((len(xts), len(xs), max(len(xt) for xt in xts)))
+    log_b = np.full(M.shape[::2], -np.inf)
+    for k, xt in enumerate(xts):
+        M[k, :, :len(xt)] = cdist(xs, xt, metric)
+        log_b[k, :len(xt)] = -np.log(len(xt))
+    return M, log_b
+
+def sinkhorn(xs, xt, metric='euclidean', reg=1e-2, tol=1e-6, max_iter=1000):
+    """
+    Entropic approximation of emd(xs, xt). The transport plan minimises the
+    squared distances plus reg times the largest squared distance times the
+    negative entropy, and the returned cost is its mean distance, as in emd.
+    xt is a point set, or a list of point sets that are all solved against
+    xs at once.
+
+    Iterates until the L1 error of the row marginals is below tol, checked
+    every CHECK_EVERY iterations, or for max_iter iterations. Returns the
+    cost (an array for a list of xt) and a dict with the 'iterations', the
+    marginal 'error' and whether every problem 'converged'.
+    """
+    if max_iter < 1:
+        raise ValueError(f"max_iter={max_iter} has to be at least 1!")
+    batch = type(xt) == list
+    xts = [np.asarray(x, dtype=float).reshape(len(x), -1)
+                                    for x in (xt if batch else [xt])]
+    xs = np.asarray(xs, dtype=float).reshape(len(xs), -1)
+
+    M, log_b = _padded_costs(xs, xts, metric)
+    C = M**2
+    scale = C.max(axis=(1,2), keepdims=True)
+    C = C / np.where(scale > 0, scale, 1.)
+    log_a = np.full(len(xs), -np.log(len(xs)))
+
+    # converged problems are dropped from the active arrays ending in _a
+    f = np.zeros((len(xts), len(xs)))
+    g = np.zeros_like(log_b)
+    error      = np.full(len(xts), np.inf)
+    iterations = np.zeros(len(xts), dtype=np.int64)
+    converged  = np.zeros(len(xts), dtype=bool)
+    active = np.arange(len(xts))
+    C_a, log_b_a, g_a = C, log_b, g
+    for n in range(1, max_iter+1):
+        f_a = reg * (log_a - logsumexp((g_a[:,None,:] - C_a)/reg, axis=2))
+        g_a = reg * (log_b_a - logsumexp((f_a[:,:,None] - C_a)/reg, axis=1))
+        iterations[active] = n
+        if n % CHECK_EVERY and n < max_iter:
+            continue
+
+        log_P = (f_a[:,:,None] + g_a[:,None,:] - C_a)/reg
+        error[active] = np.abs(np.exp(logsumexp(log_P, axis=2)) -
+                               np.exp(log_a)).sum(axis=1)
+        f[active], g[active] = f_a, g_a
+        done = error[active] < tol
+        converged[active] = done
+        if done.all():
+            break
+        if done.any():
+            active = active[~done]
+            C_a, log_b_a, g_a = C[active], log_b[active], g_a[~done]
+
+    log_P = (f[:,:,None] + g[:,None,:] - C)/reg
+    cost = np.sum(M * np.exp(log_P), axis=(1,2))
+    log = {'iterations' : iterations,
+           'error'      : error,
+           'converged'  : converged}
+    if not batch:
+        cost = float(cost[0])
+        log = {key:value[0] for key,value in log.items()}
+    return cost, log